@@ -1,7 +1,13 @@
 from flask import Flask
 from mealswap import commands
-from mealswap.controllers import add, diet, edit, public, rate, search, user
+from mealswap.controllers import add, api, diet, edit, public, rate, search, user
 from mealswap.controllers.controls import get_element_by_id, Model
+from mealswap.controllers.search.index import init_index
+from mealswap.controllers.api.helpers import init_suggestions
+from mealswap.controllers.diet.helpers import init_calendar
+from mealswap.models.changes import init_changes
+from mealswap.models.fulltext import init_fulltext
+from mealswap.models.identity import init_identity_cache
 from mealswap.extensions import (
     login_manager,
     db,
@@ -22,6 +28,7 @@ def create_app(config='mealswap.settings') -> Flask:
     register_extensions(app)
     register_blueprints(app)
     register_commands(app)
+    register_indexes(app)
     return app
 
 
@@ -37,6 +44,7 @@ def register_extensions(app):
 def register_blueprints(app):
     """Registers Flask blueprints"""
     app.register_blueprint(add.views.blueprint)
+    app.register_blueprint(api.views.blueprint)
     app.register_blueprint(diet.views.blueprint)
     app.register_blueprint(edit.views.blueprint)
     app.register_blueprint(public.views.blueprint)
@@ -49,8 +57,27 @@ def register_blueprints(app):
 def register_commands(app):
     """Registers Click commands"""
     app.cli.add_command(commands.create)
+    app.cli.add_command(commands.upgrade)
+    app.cli.add_command(commands.rebuild_summaries)
+    app.cli.add_command(commands.rebuild_fulltext)
+    app.cli.add_command(commands.recompute_meals)
+    app.cli.add_command(commands.explain_queries)
+    app.cli.add_command(commands.query_counts)
     app.cli.add_command(commands.add_admin)
     app.cli.add_command(commands.import_meals)
+    app.cli.add_command(commands.import_products)
+    app.cli.add_command(commands.train_recommender)
+    return None
+
+
+def register_indexes(app):
+    """Builds in-process indexes and registers events that keep them current"""
+    init_changes()
+    init_index(app)
+    init_fulltext()
+    init_suggestions(app)
+    init_calendar()
+    init_identity_cache()
     return None
 
 
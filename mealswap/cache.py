@@ -0,0 +1,244 @@
+"""Key-value caches with TTL and LRU eviction"""
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class MemoryBackend:
+    """A class used to cache values in the memory of the current process."""
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        """
+        :param max_size: maximum number of cached values, least recently used values are evicted first
+        :param ttl: number of seconds after which a value expires
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.data = OrderedDict()
+
+    def get(self, key: str):
+        """
+        Returns cached value.
+
+        :param key: key of the value
+        :return: cached value or None if not found or expired
+        """
+        with self.lock:
+            entry = self.data.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        """
+        Caches value.
+
+        :param key: key of the value
+        :param value: value to be cached
+        :param ttl: number of seconds after which the value expires. Default None means backend ttl.
+        :return: None
+        """
+        with self.lock:
+            self.data[key] = (value, time.monotonic() + (ttl or self.ttl))
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_size:
+                self.data.popitem(last=False)
+
+        return None
+
+    def delete(self, key: str) -> None:
+        """
+        Removes value from the cache.
+
+        :param key: key of the value
+        :return: None
+        """
+        with self.lock:
+            self.data.pop(key, None)
+
+        return None
+
+    def clear(self) -> None:
+        """
+        Removes all values from the cache.
+
+        :return: None
+        """
+        with self.lock:
+            self.data.clear()
+
+        return None
+
+
+class SQLiteBackend:
+    """A class used to cache values in an SQLite file shared by all processes of the app."""
+
+    def __init__(self, path: str, max_size: int = 100000, ttl: float = 3600):
+        """
+        :param path: path of the cache file
+        :param max_size: maximum number of cached values, least recently used values are evicted first
+        :param ttl: number of seconds after which a value expires
+        """
+        self.path = path
+        self.max_size = max_size
+        self.ttl = ttl
+        self.local = threading.local()
+        with self.connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS cache "
+                               "(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS ix_cache_accessed ON cache (accessed)")
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns connection to the cache file for the current thread"""
+        if getattr(self.local, 'connection', None) is None:
+            self.local.connection = sqlite3.connect(self.path, timeout=5)
+        return self.local.connection
+
+    def get(self, key: str):
+        """
+        Returns cached value.
+
+        :param key: key of the value
+        :return: cached value or None if not found or expired
+        """
+        now = time.time()
+        with self.connection() as connection:
+            row = connection.execute("SELECT value FROM cache WHERE key = ? AND expires >= ?", (key, now)).fetchone()
+            if row is None:
+                return None
+            connection.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        """
+        Caches value.
+
+        :param key: key of the value
+        :param value: value to be cached
+        :param ttl: number of seconds after which the value expires. Default None means backend ttl.
+        :return: None
+        """
+        now = time.time()
+        with self.connection() as connection:
+            connection.execute("REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                               (key, pickle.dumps(value), now + (ttl or self.ttl), now))
+            connection.execute("DELETE FROM cache WHERE expires < ?", (now,))
+            connection.execute("DELETE FROM cache WHERE key IN "
+                               "(SELECT key FROM cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_size,))
+
+        return None
+
+    def delete(self, key: str) -> None:
+        """
+        Removes value from the cache.
+
+        :param key: key of the value
+        :return: None
+        """
+        with self.connection() as connection:
+            connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+        return None
+
+    def clear(self) -> None:
+        """
+        Removes all values from the cache.
+
+        :return: None
+        """
+        with self.connection() as connection:
+            connection.execute("DELETE FROM cache")
+
+        return None
+
+
+class RedisBackend:
+    """A class used to cache values in Redis or a Redis-compatible server.
+
+    The redis package is needed only when this backend is used. Eviction of least recently used values is left to the
+    server (maxmemory-policy).
+    """
+
+    def __init__(self, url: str, ttl: float = 3600, prefix: str = 'mealswap:'):
+        """
+        :param url: URL of the server, e.g. redis://localhost:6379/0
+        :param ttl: number of seconds after which a value expires
+        :param prefix: prefix added to all keys
+        """
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str):
+        """
+        Returns cached value.
+
+        :param key: key of the value
+        :return: cached value or None if not found or expired
+        """
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key: str, value, ttl: float = None) -> None:
+        """
+        Caches value.
+
+        :param key: key of the value
+        :param value: value to be cached
+        :param ttl: number of seconds after which the value expires. Default None means backend ttl.
+        :return: None
+        """
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=int(ttl or self.ttl))
+
+        return None
+
+    def delete(self, key: str) -> None:
+        """
+        Removes value from the cache.
+
+        :param key: key of the value
+        :return: None
+        """
+        self.client.delete(self.prefix + key)
+
+        return None
+
+    def clear(self) -> None:
+        """
+        Removes all values with the prefix from the cache.
+
+        :return: None
+        """
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+        return None
+
+
+def make_backend(url: str, max_size: int = 1024, ttl: float = 3600):
+    """
+    Creates a cache backend from URL.
+
+    Supported URLs: 'memory://', 'sqlite:///path/to/file.db', 'redis://host:port/db'.
+
+    :param url: URL of the backend
+    :param max_size: maximum number of cached values (memory and SQLite backends)
+    :param ttl: number of seconds after which a value expires
+    :return: cache backend
+    """
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):], max_size=max_size, ttl=ttl)
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url, ttl=ttl)
+    if url.startswith('memory://'):
+        return MemoryBackend(max_size=max_size, ttl=ttl)
+    raise ValueError(f'Unsupported cache URL: {url}')
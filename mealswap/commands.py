@@ -1,9 +1,25 @@
 import click
+from flask import current_app, url_for
 from mealswap.extensions import db
-from mealswap.models.models import User, Item, Product, ItemProductAssoc
+from mealswap.models.models import User, Item, DayDiet
+from mealswap.models.schema import upgrade_schema, explain_statement, full_scans
+from mealswap.models.summary import rebuild_day_summaries
+from mealswap.models.fulltext import fulltext_available, create_fulltext_tables
+from mealswap.models.nutrients import NUTRIENTS
+from mealswap.querycount import count_queries, assert_max_queries
+from mealswap.importer import run_import
+from mealswap.controllers.controls import Model, get_element_by_id, get_element_list_by_ids, get_elements_in_order, \
+    get_user_by_email, get_diet_by_date, get_diet_items, get_diet_totals, get_history, get_diet_days, \
+    get_saved_items, get_saved_item_vectors, get_saved_item_names, get_product_names, get_catalogue_version, \
+    get_open_items_by_user, get_saved_items_by_name, get_saved_composed_items_by_name, get_products_by_name, \
+    get_ratings_by_user, get_unrated_items, sample_unrated_item_ids, get_ratings_by_user_and_name, \
+    get_rating_triples, get_ratings_count_by_user, get_rating_by_ids, get_settings_by_user, \
+    get_items_containing_products_query, recompute_composed_items
+from sqlalchemy.orm import make_transient_to_detached
+from mealswap.controllers.search.recommender import train_model, save_model
 from werkzeug.security import generate_password_hash
 import datetime as dt
-import csv
+from types import SimpleNamespace
 
 
 @click.command(name='create')
@@ -12,7 +28,216 @@ def create() -> None:
 
     :return: None
     """
-    db.create_all()
+    upgrade_schema()
+    return None
+
+
+@click.command(name='upgrade')
+def upgrade() -> None:
+    """Creates missing tables and indexes in an existing database.
+
+    :return: None
+    """
+    applied = upgrade_schema()
+    if applied:
+        print(f"Applied schema versions: {', '.join(str(version) for version in applied)}")
+    else:
+        print("Schema is up to date")
+    return None
+
+
+@click.command(name='rebuild_summaries')
+@click.option('--batch-size', type=int, default=500, help='Number of diets computed in one query.')
+def rebuild_summaries(batch_size: int) -> None:
+    """Recomputes nutrition totals of all diet days.
+
+    :param batch_size: number of diets computed in one query
+    :return: None
+    """
+    count = rebuild_day_summaries(batch_size)
+    db.session.commit()
+    print(f"Rebuilt summaries of {count} diet days")
+    return None
+
+
+@click.command(name='rebuild_fulltext')
+def rebuild_fulltext() -> None:
+    """Creates full-text tables if needed and fills them again with names of all items and products.
+
+    :return: None
+    """
+    count = create_fulltext_tables()
+    db.session.commit()
+    print(f"Indexed {count} names")
+    return None
+
+
+@click.command(name='recompute_meals')
+@click.option('--product-id', 'product_ids', type=int, multiple=True,
+              help='Id of a changed product, only meals containing it are recomputed. Can be repeated.')
+def recompute_meals(product_ids: tuple) -> None:
+    """Recomputes nutrition values of composed meals from their products.
+
+    :param product_ids: ids of changed products, empty means all composed meals
+    :return: None
+    """
+    changed = recompute_composed_items(list(product_ids) if product_ids else None)
+    print(f"Updated {len(changed)} meals")
+    return None
+
+
+def stub(model, element_id: int) -> db.Model:
+    """
+    Returns a persistent object of the model with only its id set, without loading or requiring its row.
+
+    Relationships of the stub are loaded with the same queries as relationships of real objects.
+
+    :param model: model class, e.g. DayDiet
+    :param element_id: id of the object
+    :return: object of the model attached to the session
+    """
+    instance = model.__mapper__.class_manager.new_instance()
+    instance.id = element_id
+    make_transient_to_detached(instance)
+    return db.session.merge(instance, load=False)
+
+
+def hot_queries() -> list:
+    """
+    Returns calls of controls with the tables their queries are allowed to scan.
+
+    Calls run the actual functions, so that the checked queries are the ones that pages execute.
+
+    :return: list of (name, function without arguments, tables allowed to be scanned) tuples
+    """
+    today = dt.date.today()
+    user = SimpleNamespace(id=1)
+    return [
+        ('get_element_by_id', lambda: get_element_by_id(Model.ITEM, 1, load='meal'), ()),
+        ('get_element_list_by_ids', lambda: get_element_list_by_ids(Model.ITEM, [1, 2, 3]), ()),
+        ('get_elements_in_order', lambda: get_elements_in_order(Model.ITEM, [3, 2, 1], columns=NUTRIENTS), ()),
+        ('get_user_by_email', lambda: get_user_by_email('admin@example.com'), ()),
+        ('get_diet_by_date', lambda: get_diet_by_date(today), ()),
+        ('get_diet_items', lambda: get_diet_items(stub(DayDiet, 1)), ()),
+        ('get_diet_totals', lambda: get_diet_totals(stub(DayDiet, 1)), ()),
+        ('get_history', lambda: get_history(user, today, today).all(), ()),
+        ('get_diet_days', lambda: get_diet_days(user, today.year, today.month), ()),
+        ('get_saved_items', lambda: get_saved_items(paginate=True, page=1, per_page=5), ()),
+        ('get_saved_item_vectors', get_saved_item_vectors, ()),
+        ('get_saved_item_names', get_saved_item_names, ()),
+        ('get_product_names', get_product_names, ('product',)),
+        ('get_catalogue_version', get_catalogue_version, ('product',)),
+        ('get_open_items_by_user', lambda: get_open_items_by_user(user), ()),
+        ('get_saved_items_by_name', lambda: get_saved_items_by_name('a', paginate=True, page=1, per_page=5), ()),
+        ('get_saved_composed_items_by_name',
+         lambda: get_saved_composed_items_by_name('a', pagination=True, page=1, per_page=5), ()),
+        ('get_products_by_name', lambda: get_products_by_name('a', paginate=True, page=1, per_page=5),
+         ('product',)),
+        ('get_ratings_by_user', lambda: get_ratings_by_user(user), ()),
+        ('get_unrated_items', lambda: get_unrated_items(user, 'a'), ()),
+        ('get_unrated_items without name', lambda: get_unrated_items(user), ()),
+        ('sample_unrated_item_ids', lambda: sample_unrated_item_ids(user, 3), ()),
+        ('sample_unrated_item_ids fallback', lambda: sample_unrated_item_ids(user, 1, rounds=0), ()),
+        ('get_ratings_by_user_and_name', lambda: get_ratings_by_user_and_name(user, 'a', 5), ()),
+        ('get_rating_triples', get_rating_triples, ('ratings_assoc',)),
+        ('get_ratings_count_by_user', lambda: get_ratings_count_by_user(user), ()),
+        ('get_rating_by_ids', lambda: get_rating_by_ids(1, 1), ()),
+        ('get_settings_by_user', lambda: get_settings_by_user(stub(User, 1)), ()),
+        ('DayDiet.items', lambda: stub(DayDiet, 1).items, ()),
+        ('Item.products', lambda: stub(Item, 1).products, ()),
+        ('get_items_containing_products_query', lambda: get_items_containing_products_query([1]).all(), ()),
+    ]
+
+
+@click.command(name='explain_queries')
+def explain_queries() -> None:
+    """Prints query plans of the queries executed by controls and fails if any of them scans a whole table.
+
+    :return: None
+    """
+    # the full-text tables are looked up once per database, not by every search
+    fulltext_available()
+    failed = []
+    for name, function, allowed in hot_queries():
+        db.session.expunge_all()
+        with count_queries() as counter:
+            try:
+                function()
+            except LookupError:
+                # e.g. a User without Settings, the executed queries are checked anyway
+                pass
+        db.session.rollback()
+        plan = []
+        for statement, parameters in zip(counter.statements, counter.parameters):
+            if statement.lstrip().upper().startswith('SELECT'):
+                plan += explain_statement(statement, parameters)
+        scans = [step for step in full_scans(plan) if step.split()[1] not in allowed]
+        print(f"{'FAIL' if scans else 'ok'}\t{name}: {'; '.join(plan)}")
+        if scans:
+            failed.append(name)
+    if failed:
+        raise click.ClickException(f"Full table scans in: {', '.join(failed)}")
+    return None
+
+
+def page_query_budgets(user: User) -> list:
+    """
+    Returns pages rendered for the user with the maximum number of queries each of them may execute.
+
+    :param user: User object the pages are requested for
+    :return: list of (name, url, maximum number of queries) tuples
+    """
+    today = dt.date.today()
+    pages = [
+        ('diet.calendar', url_for('diet.calendar'), 3),
+        ('diet.day', url_for('diet.day', date=today), 6),
+        ('search.search_replace', url_for('search.search_replace', searched='a'), 5),
+        ('search.search_macro', url_for('search.search_macro', protein=1, carb=1, fat=1), 3),
+        ('search.search_discover', url_for('search.search_discover'), 4),
+        ('rate.rate_search', url_for('rate.rate_search', searched='a'), 3),
+        ('rate.rate_discover', url_for('rate.rate_discover'), 8),
+        ('edit.edit_meals', url_for('edit.edit_meals'), 4),
+        ('edit.edit_ratings_search', url_for('edit.edit_ratings_search', searched='a'), 3),
+        ('user.settings', url_for('user.settings'), 3),
+        ('api.suggest', url_for('api.suggest', q='a'), 2),
+        ('api.history', url_for('api.history', **{'from': today - dt.timedelta(days=365), 'to': today}), 2),
+    ]
+    item = Item.query.filter_by(saved=False, user_id=user.id).first()
+    if item is not None:
+        pages.append(('add.compose_meal', url_for('add.compose_meal', item_id=item.id), 4))
+    return pages
+
+
+@click.command(name='query_counts')
+@click.option('--user-id', type=int, default=1, help='Id of the user the pages are requested for.')
+def query_counts(user_id: int) -> None:
+    """Requests pages as a user and fails if any of them executes more queries than its budget.
+
+    :param user_id: id of the user
+    :return: None
+    """
+    user = db.session.get(User, user_id)
+    if user is None:
+        raise click.ClickException(f"User {user_id} not found")
+    with current_app.test_request_context():
+        pages = page_query_budgets(user)
+    client = current_app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+        session['_fresh'] = True
+    failed = []
+    for name, url, limit in pages:
+        # a new app context for every request, so that the session and the logged in user are not reused
+        try:
+            with current_app.app_context(), assert_max_queries(limit, name) as counter:
+                response = client.get(url)
+        except AssertionError as error:
+            print(f"FAIL\t{error}")
+            failed.append(name)
+            continue
+        print(f"ok\t{name}: {len(counter)}/{limit} queries, status {response.status_code}")
+    if failed:
+        raise click.ClickException(f"Query budget exceeded in: {', '.join(failed)}")
     return None
 
 
@@ -42,78 +267,81 @@ def add_admin(name: str, email: str, password: str) -> None:
 @click.command(name='import_meals')
 @click.option('--file', prompt='File directory')
 @click.option('--email', prompt='Added by user (email)')
-def import_meals(file: str, email: str) -> None or int:
+@click.option('--batch-size', type=int, default=5000, help='Number of rows inserted and committed at once.')
+@click.option('--resume', is_flag=True, help='Skip rows committed by a previous, failed run.')
+@click.option('--workers', type=int, default=None, help='Number of validation processes (default: all cores).')
+def import_meals(file: str, email: str, batch_size: int, resume: bool, workers: int or None) -> None or int:
     """
     Imports meals from a .csv file.
     Function uses following columns: name, protein, carbohydrates, fat, link
 
     :param file: filename of the .csv file
     :param email: Email address of the user adding the data.
+    :param batch_size: number of rows inserted and committed at once
+    :param resume: if True, rows committed by a previous run are skipped
+    :param workers: number of validation processes
     :return: -1 if user has not been found, None otherwise
     """
-    with open(file, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        user = db.session.query(User).filter(User.email == email).first()
-        if not user:
-            print('User not found')
-            return -1
-        for row in reader:
-            item = Item(name=row['name'],
-                        protein=float(row['protein']),
-                        carb=float(row['carbohydrates']),
-                        fat=float(row['fat']),
-                        user=user,
-                        has_weight=False,
-                        link=row['link'],
-                        saved=True,
-                        qty=1,
-                        servings=1)
-            db.session.add(item)
-        db.session.commit()
-        return None
+    user = db.session.query(User).filter(User.email == email).first()
+    if not user:
+        print('User not found')
+        return -1
+    counts = run_import(file, 'meals', user.id, batch_size=batch_size, resume=resume, workers=workers)
+    print(f"Imported {counts['imported']} meals, skipped {counts['duplicate']} duplicates and "
+          f"{counts['invalid']} invalid rows")
+    return None
 
 
 @click.command(name='import_products')
 @click.option('--file', prompt='File directory')
 @click.option('--email', prompt='Added by user (email)')
-def import_products(file: str, email: str) -> None or int:
+@click.option('--batch-size', type=int, default=5000, help='Number of rows inserted and committed at once.')
+@click.option('--resume', is_flag=True, help='Skip rows committed by a previous, failed run.')
+@click.option('--workers', type=int, default=None, help='Number of validation processes (default: all cores).')
+def import_products(file: str, email: str, batch_size: int, resume: bool, workers: int or None) -> None or int:
     """
     Imports products from a .csv file.
     Function uses following columns: name, protein, carbohydrates, fat
 
     :param file: filename of the .csv file
     :param email: Email address of the user adding the data.
+    :param batch_size: number of rows inserted and committed at once
+    :param resume: if True, rows committed by a previous run are skipped
+    :param workers: number of validation processes
     :return: -1 if user has not been found, None otherwise
     """
-    with open(file, 'r', newline='') as csvfile:
-        reader = csv.DictReader(csvfile)
-        user = db.session.query(User).filter(User.email == email).first()
-        if not user:
-            print('User not found')
-            return -1
-        for row in reader:
-            product = Product(
-                name=row['name'],
-                protein=float(row['protein']),
-                carb=float(row['carbohydrates']),
-                fat=float(row['fat']),
-                weight_per_ea=0
-            )
-            item = Item(
-                name=row['name'],
-                protein=float(row['protein']),
-                carb=float(row['carbohydrates']),
-                fat=float(row['fat']),
-                has_weight=True,
-                user=user,
-                qty=0,
-                servings=0,
-                saved=True
-            )
-            db.session.add(product)
-            assoc = ItemProductAssoc(qty=100)
-            assoc.product = product
-            item.products.append(assoc)
-            db.session.add(item)
-        db.session.commit()
-        return None
+    user = db.session.query(User).filter(User.email == email).first()
+    if not user:
+        print('User not found')
+        return -1
+    counts = run_import(file, 'products', user.id, batch_size=batch_size, resume=resume, workers=workers)
+    print(f"Imported {counts['imported']} products, skipped {counts['duplicate']} duplicates and "
+          f"{counts['invalid']} invalid rows")
+    return None
+
+
+@click.command(name='train_recommender')
+@click.option('--features', default=10, help='Number of features for each user/item')
+@click.option('--lambda', 'lambda_', default=10.0, help='Regularization parameter')
+@click.option('--method', type=click.Choice(['newton-cg', 'als']), default='newton-cg', help='Training algorithm')
+@click.option('--iterations', default=20, type=click.IntRange(min=1), help='Maximum number of ALS sweeps')
+@click.option('--workers', default=None, type=int, help='Number of ALS worker processes (default: all cores)')
+@click.option('--warm/--cold', default=True, help='Start from the factors of the saved model')
+def train_recommender(features: int, lambda_: float, method: str, iterations: int, workers: int or None,
+                      warm: bool) -> None:
+    """
+    Trains the collaborative filtering model on all ratings and saves it for the app to serve.
+
+    :param features: number of features for each user/item
+    :param lambda_: regularization parameter
+    :param method: training algorithm - 'newton-cg' or 'als'
+    :param iterations: maximum number of ALS sweeps
+    :param workers: number of ALS worker processes
+    :param warm: if True, training starts from the factors of the saved model
+    :return: None
+    """
+    model = train_model(num_features=features, lambda_=lambda_, method=method, iterations=iterations,
+                        workers=workers, warm_start=warm)
+    save_model(model)
+    print(f"Model trained for {len(model['user_ids'])} users and {len(model['item_ids'])} items")
+    return None
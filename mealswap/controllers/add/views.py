@@ -86,7 +86,7 @@ def compose_meal(item_id: str) -> str or Response:
         redirect to compose_search if searched for a product to add OR
         redirect to add_meal if the current meal has been saved
     """
-    item = get_element_by_id(Model.ITEM, item_id)
+    item = get_element_by_id(Model.ITEM, item_id, load='meal')
     # prevent user from accessing a saved meal or another user's meal
     if item.saved or item.user != current_user:
         return abort(code=403)
@@ -205,7 +205,7 @@ def compose_copy(item_id: str, searched: str) -> str or Response:
         request_list = list(request.form)
         copy_item_id = request_list[0]
 
-        copy_item = get_element_by_id(Model.ITEM, copy_item_id)
+        copy_item = get_element_by_id(Model.ITEM, copy_item_id, load='meal')
         item = get_element_by_id(Model.ITEM, item_id)
         copy_meal(item, copy_item)
 
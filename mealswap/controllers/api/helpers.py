@@ -0,0 +1,237 @@
+import csv
+import io
+import json
+import threading
+from bisect import bisect_left
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from mealswap.models.models import Item, Product
+from mealswap.models.changes import ChangeTracker, VersionCheck
+from mealswap.models.fulltext import fold
+from mealswap.controllers.controls import get_saved_item_names, get_product_names, get_catalogue_version
+from mealswap.settings import INDEX_CHECK_TTL
+
+# columns of rows returned by controls.get_history
+HISTORY_COLUMNS = ('date', 'calories', 'protein', 'carb', 'fat', 'item_count', 'weight')
+
+
+class NameIndex:
+    """A class used to suggest item and product names by prefix.
+
+    Every word of a name is stored as a key (folded name from that word to the end) in a sorted list, so that a prefix
+    lookup is a binary search followed by reading the next entries. Like the item index, it is rebuilt when a version
+    check notices names changed by other processes.
+    """
+
+    def __init__(self, ttl: float = 10):
+        """
+        :param ttl: minimum number of seconds between checks for changes made by other processes
+        """
+        self.lock = threading.Lock()
+        self.built = False
+        self.version = VersionCheck(get_catalogue_version, ttl)
+        self.keys = []
+        self.entries = []
+        self.names = {}
+
+    def build(self, items: list = None, products: list = None) -> None:
+        """
+        (Re)builds the index.
+
+        :param items: list of (id, name) tuples of saved items. Default None means that they are read from database
+        :param products: list of (id, name) tuples of products. Default None means that they are read from database
+        :return: None
+        """
+        if items is None or products is None:
+            self.version.read()
+        if items is None:
+            items = get_saved_item_names()
+        if products is None:
+            products = get_product_names()
+        names = {('item', item_id): name for item_id, name in items}
+        names.update({('product', product_id): name for product_id, name in products})
+        pairs = sorted((key, (kind, element_id)) for (kind, element_id), name in names.items()
+                       for key in self.keys_for(name))
+        with self.lock:
+            self.keys = [key for key, _ in pairs]
+            self.entries = [entry for _, entry in pairs]
+            self.names = names
+            self.built = True
+
+        return None
+
+    @staticmethod
+    def keys_for(name: str) -> list:
+        """
+        Returns keys under which the name is stored - folded name starting from each of its words.
+
+        :param name: item or product name
+        :return: list of keys
+        """
+        folded = fold(name)
+        return [folded[i:] for i in range(len(folded))
+                if not folded[i].isspace() and (i == 0 or folded[i - 1].isspace())]
+
+    def add(self, kind: str, element_id: int, name: str) -> None:
+        """
+        Adds or replaces a name in the index.
+
+        :param kind: 'item' or 'product'
+        :param element_id: id of the item or product
+        :param name: name to be suggested
+        :return: None
+        """
+        with self.lock:
+            self._remove((kind, element_id))
+            self.names[(kind, element_id)] = name
+            for key in self.keys_for(name):
+                position = bisect_left(self.keys, key)
+                self.keys.insert(position, key)
+                self.entries.insert(position, (kind, element_id))
+
+        return None
+
+    def remove(self, kind: str, element_id: int) -> None:
+        """
+        Removes a name from the index.
+
+        :param kind: 'item' or 'product'
+        :param element_id: id of the item or product
+        :return: None
+        """
+        with self.lock:
+            self._remove((kind, element_id))
+
+        return None
+
+    def _remove(self, entry: tuple) -> None:
+        """Removes all keys of the entry, the lock has to be held by the caller."""
+        name = self.names.pop(entry, None)
+        if name is None:
+            return None
+        for key in self.keys_for(name):
+            position = bisect_left(self.keys, key)
+            while self.entries[position] != entry:
+                position += 1
+            del self.keys[position]
+            del self.entries[position]
+
+        return None
+
+    def suggest(self, prefix: str, limit: int = 10) -> list:
+        """
+        Returns names that have a word starting with the prefix.
+
+        :param prefix: beginning of the searched name
+        :param limit: maximum number of returned names
+        :return: list of dictionaries with name, type and id, names are not repeated
+        """
+        prefix = fold(prefix).strip()
+        if not prefix:
+            return []
+        if not self.built or self.version.stale():
+            self.build()
+        suggestions = []
+        seen = set()
+        with self.lock:
+            position = bisect_left(self.keys, prefix)
+            while position < len(self.keys) and len(suggestions) < limit and self.keys[position].startswith(prefix):
+                kind, element_id = self.entries[position]
+                name = self.names[(kind, element_id)]
+                if name not in seen:
+                    seen.add(name)
+                    suggestions.append({'name': name, 'type': kind, 'id': element_id})
+                position += 1
+        return suggestions
+
+
+name_index = NameIndex(ttl=INDEX_CHECK_TTL)
+
+
+def _apply_changes(changes: dict) -> None:
+    """Patches the index with names changed in the committed transaction."""
+    if not name_index.built:
+        return None
+    for (kind, element_id), name in changes.items():
+        if name is not None:
+            name_index.add(kind, element_id, name)
+        else:
+            name_index.remove(kind, element_id)
+
+    return None
+
+
+name_changes = ChangeTracker('name_index', _apply_changes)
+
+
+def _record_change(mapper, connection, target) -> None:
+    """Records name of changed Item or Product, so that the index can be patched after commit."""
+    kind = 'product' if isinstance(target, Product) else 'item'
+    name = target.name if kind == 'product' or target.saved else None
+    name_changes.record(target, (kind, target.id), name)
+
+    return None
+
+
+def _record_delete(mapper, connection, target) -> None:
+    """Records deleted Item or Product, so that it can be removed from the index after commit."""
+    kind = 'product' if isinstance(target, Product) else 'item'
+    name_changes.record(target, (kind, target.id), None)
+
+    return None
+
+
+def init_suggestions(app) -> None:
+    """
+    Builds the name index for the app and registers events that keep it current.
+
+    :param app: Flask app
+    :return: None
+    """
+    if not event.contains(Item, 'after_insert', _record_change):
+        for model in (Item, Product):
+            event.listen(model, 'after_insert', _record_change)
+            event.listen(model, 'after_update', _record_change)
+            event.listen(model, 'after_delete', _record_delete)
+    with app.app_context():
+        try:
+            name_index.build()
+        except OperationalError:
+            # tables have not been created yet - the index will be built on first use
+            name_index.built = False
+
+    return None
+
+
+def history_json(rows):
+    """
+    Streams history rows as a JSON list of objects.
+
+    :param rows: iterable of rows returned by controls.get_history
+    :return: generator of JSON chunks
+    """
+    separator = '['
+    for row in rows:
+        record = dict(zip(HISTORY_COLUMNS, row))
+        record['date'] = record['date'].isoformat()
+        yield separator + json.dumps(record)
+        separator = ',\n'
+    yield '[]' if separator == '[' else ']'
+
+
+def history_csv(rows):
+    """
+    Streams history rows as CSV with a header line.
+
+    :param rows: iterable of rows returned by controls.get_history
+    :return: generator of CSV lines
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(HISTORY_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
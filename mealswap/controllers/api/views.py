@@ -0,0 +1,46 @@
+import datetime as dt
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_login import login_required, current_user
+from mealswap.controllers.controls import get_history
+from .helpers import name_index, history_json, history_csv
+
+blueprint = Blueprint('api', __name__, static_folder='../static')
+
+
+@blueprint.route('/api/suggest')
+@login_required
+def suggest() -> Response:
+    """Returns item and product names that have a word starting with the searched string.
+
+    :return: JSON list of {name, type, id} objects
+    """
+    query = request.args.get('q', '')
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    return jsonify(name_index.suggest(query, limit))
+
+
+@blueprint.route('/api/history')
+@login_required
+def history() -> Response:
+    """Returns nutrition totals and weight of the current user for every day with a diet in a date range.
+
+    Query arguments: 'from' and 'to' (YYYY-MM-DD, both inclusive, default: the last 30 days) and 'format' ('json' or
+    'csv', default 'json').
+
+    :return: streamed JSON list of {date, calories, protein, carb, fat, item_count, weight} objects or CSV OR
+        error 400 if arguments are invalid
+    """
+    try:
+        last_day = dt.date.fromisoformat(request.args.get('to', dt.date.today().isoformat()))
+        first_day = dt.date.fromisoformat(request.args.get('from', (last_day - dt.timedelta(days=29)).isoformat()))
+    except ValueError:
+        return jsonify(error="Dates have to be in YYYY-MM-DD format."), 400
+    output = request.args.get('format', 'json')
+    if output not in ('json', 'csv'):
+        return jsonify(error="Format has to be 'json' or 'csv'."), 400
+
+    rows = get_history(current_user, first_day, last_day)
+    if output == 'csv':
+        return Response(stream_with_context(history_csv(rows)), mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename=history_{first_day}_{last_day}.csv'})
+    return Response(stream_with_context(history_json(rows)), mimetype='application/json')
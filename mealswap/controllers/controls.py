@@ -1,11 +1,19 @@
 from flask_sqlalchemy import Pagination
 
 from mealswap.models.models import *
+from mealswap.models.fulltext import filter_by_name, name_rank
+from mealswap.models.summary import totals_query, update_day_summary, rebuild_day_summaries
+from mealswap.models.nutrients import NUTRIENTS, NutrientVector, to_matrix, weighted_averages
+from mealswap.models.identity import identity_cache
 from mealswap.extensions import db
+from mealswap.controllers.pagination import KeysetPage, paginate_query
 from enum import Enum
 import datetime as dt
 from werkzeug.security import generate_password_hash
 import calendar
+import random
+import numpy as np
+from scipy import sparse
 
 
 # model class
@@ -31,32 +39,98 @@ dictionary = {0: User,
               7: Product}
 
 
-def get_element_by_id(model: Model, element_id: str or int) -> db.Model or None:
+# loader options for relationships used by templates, selected with the load argument of get_* functions
+load_profiles = {
+    'meal': (db.selectinload(Item.products).joinedload(ItemProductAssoc.product),),
+}
+
+
+# columns rendered by list and search pages, selected as named rows instead of whole ORM objects
+item_list_columns = (Item.id, Item.name, Item.link, Item.recipe, Item.has_weight, Item.servings, Item.calories,
+                     Item.protein, Item.carb, Item.fat)
+product_list_columns = (Product.id, Product.name, Product.weight_per_ea, Product.calories, Product.protein,
+                        Product.carb, Product.fat)
+
+
+def with_profile(query, load: str or None):
+    """
+    Adds loader options of the profile to the query.
+
+    :param query: SQLAlchemy query
+    :param load: name of the profile in load_profiles, None means default lazy loading
+    :return: query with loader options
+    """
+    if load is None:
+        return query
+    return query.options(*load_profiles[load])
+
+
+def get_element_by_id(model: Model, element_id: str or int, load: str = None) -> db.Model or None:
     """
     Searches the table in database and finds object by id.
 
     :param model: table in the database to be searched
     :param element_id: id of the object to be returned
+    :param load: name of the loading profile for relationships, see load_profiles. Default None means lazy loading.
     :return: database object if found else None
     """
-    return dictionary[model.value].query.filter_by(id=int(element_id)).first()
+    if load is None:
+        # objects already in the session or in the process cache are returned without a query
+        return identity_cache.get(dictionary[model.value], int(element_id))
+    return with_profile(dictionary[model.value].query, load).filter_by(id=int(element_id)).first()
 
 
-def get_element_list_by_ids(model: Model, element_ids: list, paginate=False, **kwargs) -> list or Pagination:
+def get_element_list_by_ids(model: Model, element_ids: list, paginate=False, load: str = None,
+                            **kwargs) -> list or Pagination:
     """
     Searches the table in database and finds objects by their ids.
 
     :param model: table in the database to be searched
     :param element_ids: list of ids of items to be returned
     :param paginate: boolean for paginating the results. Default is False.
+    :param load: name of the loading profile for relationships, see load_profiles. Default None means lazy loading.
     :return: list of database objects
     """
+    query = with_profile(db.session.query(dictionary[model.value]), load)\
+        .filter(dictionary[model.value].id.in_(element_ids))
     if paginate:
         page = kwargs.get('page', 1)
         per_page = kwargs.get('per_page', 5)
-        return db.session.query(dictionary[model.value])\
-            .filter(dictionary[model.value].id.in_(element_ids)).paginate(page=page, per_page=per_page)
-    return db.session.query(dictionary[model.value]).filter(dictionary[model.value].id.in_(element_ids)).all()
+        return query.paginate(page=page, per_page=per_page)
+    return query.all()
+
+
+# number of ids bound in a single IN clause, below the SQLite limit of 999 parameters of older versions
+MAX_IDS_PER_QUERY = 900
+
+
+def get_elements_in_order(model: Model, element_ids: list, columns: tuple = None, load: str = None,
+                          chunk_size: int = MAX_IDS_PER_QUERY) -> tuple:
+    """
+    Fetches objects by their ids in batches, keeping the order of the ids.
+
+    :param model: table in the database to be searched
+    :param element_ids: ordered list of ids, repeated ids are fetched once
+    :param columns: names of columns to be fetched instead of whole objects, id is always added as the first column.
+        Default None means database objects.
+    :param load: name of the loading profile for relationships, see load_profiles. Ignored if columns are given.
+    :param chunk_size: maximum number of ids in a single query
+    :return: tuple of list of objects (or rows with the columns) in the order of element_ids and list of missing ids
+    """
+    table = dictionary[model.value]
+    unique_ids = list(dict.fromkeys(int(element_id) for element_id in element_ids))
+    if columns:
+        names = ('id',) + tuple(name for name in columns if name != 'id')
+        query = db.session.query(*(getattr(table, name) for name in names))
+    else:
+        query = with_profile(db.session.query(table), load)
+    found = {}
+    for start in range(0, len(unique_ids), chunk_size):
+        chunk = unique_ids[start:start + chunk_size]
+        found.update((element.id, element) for element in query.filter(table.id.in_(chunk)))
+    elements = [found[element_id] for element_id in unique_ids if element_id in found]
+    missing = [element_id for element_id in unique_ids if element_id not in found]
+    return elements, missing
 
 
 def get_all_elements(model: Model) -> list:
@@ -89,16 +163,68 @@ def get_diet_by_date(date: str) -> DayDiet or None:
     return DayDiet.query.filter_by(date=date).first()
 
 
-def get_diets_in_current_month() -> list:
+def get_diet_items(diet: DayDiet) -> list:
     """
-    Returns list of the DayDiet objects in current month.
+    Returns positions of the diet with their Items loaded in the same query.
+
+    :param diet: DayDiet object
+    :return: list of DietItemAssoc objects
+    """
+    return DietItemAssoc.query.options(db.joinedload(DietItemAssoc.item))\
+        .filter(DietItemAssoc.diet_id == diet.id).order_by(DietItemAssoc.id).all()
+
+
+def get_diet_totals(diet: DayDiet) -> dict:
+    """
+    Returns total calories and macronutrients of the diet.
+
+    Totals are read from the DaySummary of the diet, diets without a summary are computed in one aggregate query.
+
+    :param diet: DayDiet object
+    :return: dictionary with 'calories', 'protein', 'carbs' and 'fat' keys
+    """
+    summary = diet.summary
+    if summary is not None:
+        values = (summary.calories, summary.protein, summary.carb, summary.fat)
+    else:
+        row = totals_query([diet.id]).first()
+        values = row[1:5] if row is not None else (0, 0, 0, 0)
+    return dict(zip(('calories', 'protein', 'carbs', 'fat'), values))
+
 
-    :return: list of DayDiet objects
+def get_history(user: User, first_day: dt.date, last_day: dt.date, batch_size: int = 500):
     """
-    today = dt.date.today()
-    first_day = dt.date(today.year, today.month, 1)
-    last_day = dt.date(today.year, today.month, calendar.monthrange(today.year, today.month)[1])
-    return DayDiet.query.filter(DayDiet.date.between(first_day, last_day)).all()
+    Returns per-day nutrition totals and weight of User in a date range, read from DaySummary in one query.
+
+    Rows are fetched in batches while iterating, so that long ranges are not loaded at once.
+
+    :param user: User object that owns the diets
+    :param first_day: first date of the range
+    :param last_day: last date of the range (inclusive)
+    :param batch_size: number of rows fetched at once
+    :return: SQLAlchemy query of (date, calories, protein, carb, fat, item_count, weight) rows ordered by date
+    """
+    totals = (db.func.coalesce(column, 0).label(column.key) for column in
+              (DaySummary.calories, DaySummary.protein, DaySummary.carb, DaySummary.fat, DaySummary.item_count))
+    return db.session.query(DayDiet.date, *totals, DayDiet.weight)\
+        .outerjoin(DaySummary, DaySummary.diet_id == DayDiet.id)\
+        .filter(DayDiet.user_id == user.id, DayDiet.date.between(first_day, last_day))\
+        .order_by(DayDiet.date).yield_per(batch_size)
+
+
+def get_diet_days(user: User, year: int, month: int) -> set:
+    """
+    Returns days of the month that have a DayDiet of User.
+
+    :param user: User object that owns the diets
+    :param year: year of the month
+    :param month: number of the month
+    :return: set of day numbers
+    """
+    first_day = dt.date(year, month, 1)
+    last_day = dt.date(year, month, calendar.monthrange(year, month)[1])
+    return {row.date.day for row in db.session.query(DayDiet.date)
+            .filter(DayDiet.user_id == user.id, DayDiet.date.between(first_day, last_day))}
 
 
 def get_saved_items(paginate=False, **kwargs) -> list:
@@ -115,19 +241,60 @@ def get_saved_items(paginate=False, **kwargs) -> list:
     return Item.query.filter_by(saved=True).all()
 
 
+def get_saved_item_vectors() -> list:
+    """
+    Returns macronutrient values of saved Items without loading full Item objects.
+
+    :return: list of (id, protein, carb, fat, calories) tuples ordered by id
+    """
+    return db.session.query(Item.id, Item.protein, Item.carb, Item.fat, Item.calories)\
+        .filter(Item.saved == True).order_by(Item.id).all()
+
+
+def get_saved_item_names() -> list:
+    """
+    Returns names of saved Items without loading full Item objects.
+
+    :return: list of (id, name) tuples
+    """
+    return db.session.query(Item.id, Item.name).filter(Item.saved == True).all()
+
+
+def get_product_names() -> list:
+    """
+    Returns names of Products without loading full Product objects.
+
+    :return: list of (id, name) tuples
+    """
+    return db.session.query(Product.id, Product.name).all()
+
+
+def get_catalogue_version() -> tuple:
+    """
+    Returns numbers that change when saved Items or Products are added, deleted or recomputed, also by other processes.
+
+    :return: (count, highest id and total calories of saved Items, count and highest id of Products) tuple
+    """
+    product_count = db.session.query(db.func.count(Product.id)).scalar_subquery()
+    product_max_id = db.session.query(db.func.max(Product.id)).scalar_subquery()
+    return tuple(db.session.query(db.func.count(Item.id), db.func.max(Item.id), db.func.total(Item.calories),
+                                  product_count, product_max_id).filter(Item.saved == True).one())
+
+
 def get_open_items_by_user(user: User, pagination=False, **kwargs) -> list:
     """
     Returns open Items that have been created by provided User.
 
     :param user: the User object that is creator of searched meals
     :param pagination: boolean for paginating the results. Default is False.
-    :return: list of editable (not saved) Item objects
+    :return: list of editable (not saved) Items as rows with item_list_columns
     """
+    query = db.session.query(*item_list_columns).filter(Item.saved == False, Item.user_id == user.id)
     if pagination:
         page = kwargs['page']
         per_page = kwargs['per_page']
-        return Item.query.filter_by(saved=False, user_id=user.id).paginate(page=page, per_page=per_page)
-    return Item.query.filter_by(saved=False, user_id=user.id).all()
+        return query.paginate(page=page, per_page=per_page)
+    return query.all()
 
 
 def get_saved_items_by_name(name: str, paginate=False, **kwargs) -> list:
@@ -136,13 +303,14 @@ def get_saved_items_by_name(name: str, paginate=False, **kwargs) -> list:
 
     :param name: string for name search query
     :param paginate: boolean for paginating the results. Default is False.
-    :return: list of Item objects
+    :return: list of Items as rows with item_list_columns
     """
+    query = filter_by_name(db.session.query(*item_list_columns).filter(Item.saved == True), Item, name)
     if paginate:
         page = kwargs['page']
         per_page = kwargs['per_page']
-        return Item.query.filter(Item.name.contains(name), Item.saved == True).paginate(page=page, per_page=per_page)
-    return Item.query.filter(Item.name.contains(name), Item.saved == True).all()
+        return query.paginate(page=page, per_page=per_page)
+    return query.all()
 
 
 def get_saved_composed_items_by_name(name: str, pagination=False, **kwargs) -> list:
@@ -151,15 +319,16 @@ def get_saved_composed_items_by_name(name: str, pagination=False, **kwargs) -> l
 
     :param name: string for name search query
     :param pagination: boolean for paginating the results. Default is False.
-    :return: list of Item objects
+    :return: list of Items as rows with item_list_columns
     """
+    query = filter_by_name(db.session.query(*item_list_columns).filter(Item.saved == True, Item.has_weight == True,
+                                                                       Item.products is not None, Item.servings > 0),
+                           Item, name)
     if pagination:
         page = kwargs['page']
         per_page = kwargs['per_page']
-        return Item.query.filter(Item.name.contains(name), Item.saved == True, Item.has_weight == True,
-                                 Item.products is not None, Item.servings > 0).paginate(page=page, per_page=per_page)
-    return Item.query.filter(Item.name.contains(name), Item.saved == True, Item.has_weight == True,
-                             Item.products is not None, Item.servings > 0).all()
+        return query.paginate(page=page, per_page=per_page)
+    return query.all()
 
 
 def get_products_by_name(name: str, paginate=False, **kwargs) -> list:
@@ -168,13 +337,14 @@ def get_products_by_name(name: str, paginate=False, **kwargs) -> list:
 
     :param name: string for name search query
     :param paginate: boolean for paginating the results. Default is False.
-    :return: list of Product objects
+    :return: list of Products as rows with product_list_columns
     """
+    query = filter_by_name(db.session.query(*product_list_columns), Product, name)
     if paginate:
         page = kwargs.get('page', 1)
         per_page = kwargs.get('per_page', 5)
-        return Product.query.filter(Product.name.contains(name)).paginate(page=page, per_page=per_page)
-    return Product.query.filter(Product.name.contains(name)).all()
+        return query.paginate(page=page, per_page=per_page)
+    return query.all()
 
 
 def get_ratings_by_user(user: User) -> list:
@@ -187,6 +357,135 @@ def get_ratings_by_user(user: User) -> list:
     return RatingsAssoc.query.filter_by(user_id=user.id).all()
 
 
+def is_rated_by(user: User):
+    """
+    Returns EXISTS clause that is true for Items rated by User.
+
+    :param user: User object that rates Items
+    :return: SQLAlchemy clause to be used in a filter of an Item query
+    """
+    return db.session.query(RatingsAssoc.id)\
+        .filter(RatingsAssoc.user_id == user.id, RatingsAssoc.item_id == Item.id).exists()
+
+
+def get_unrated_items_query(user: User, name: str = None):
+    """
+    Returns query of saved Items that have not been rated by User.
+
+    Rated Items are excluded with a NOT EXISTS anti-join on the (user_id, item_id) index of ratings, so neither Items
+    nor ratings are loaded.
+
+    :param user: User object that rates Items
+    :param name: string for name search query. Default None means all saved Items.
+    :return: SQLAlchemy query of Item objects
+    """
+    query = Item.query.filter(Item.saved == True, ~is_rated_by(user))
+    if name is not None:
+        query = filter_by_name(query, Item, name)
+    return query
+
+
+def paginate_by_name(query, name: str or None, per_page: int, after: tuple = None,
+                     before: tuple = None) -> KeysetPage:
+    """
+    Returns a page of Items ordered by relevance to the searched name and then by id.
+
+    Without a name (or when full-text search is not available) Items are ordered by id only.
+
+    :param query: SQLAlchemy query of Item columns, filtered by name with filter_by_name
+    :param name: searched name or None
+    :param per_page: number of items per page
+    :param after: key of the last Item of the previous page
+    :param before: key of the first Item of the next page
+    :return: KeysetPage object
+    """
+    rank = name_rank(Item, name) if name is not None else None
+    if rank is None:
+        return paginate_query(query, Item.id, per_page, after, before)
+    return paginate_query(query.add_columns(rank.label('rank')), (rank, Item.id), per_page, after, before,
+                          key=lambda row: (row.rank, row.id))
+
+
+def get_unrated_items(user: User, name: str = None, per_page: int = 5, after: tuple = None,
+                      before: tuple = None) -> KeysetPage:
+    """
+    Returns a page of saved Items that have not been rated by User, ordered by relevance to the name and by id.
+
+    :param user: User object that rates Items
+    :param name: string for name search query. Default None means all saved Items.
+    :param per_page: number of items per page
+    :param after: key of the last Item of the previous page
+    :param before: key of the first Item of the next page
+    :return: KeysetPage object with Items as rows with item_list_columns
+    """
+    return paginate_by_name(get_unrated_items_query(user, name).with_entities(*item_list_columns), name, per_page,
+                            after, before)
+
+
+def sample_unrated_item_ids(user: User, n: int = 1, rounds: int = 4, oversample: int = 4) -> list:
+    """
+    Draws ids of uniformly random saved Items that have not been rated by User.
+
+    Candidate ids are drawn from the range of Item ids and checked in one query per round; ids of deleted, open or
+    rated Items are rejected. Candidates are never materialized, so the cost does not depend on the catalogue size.
+    If most Items have been rated and rounds run out, the rest is drawn with ORDER BY random().
+
+    :param user: User object that rates Items
+    :param n: number of ids to be drawn
+    :param rounds: number of rounds of id-range sampling
+    :param oversample: number of candidate ids drawn per missing id in a round
+    :return: list of up to n distinct Item ids in random order
+    """
+    # separate subqueries, SQLite reads min() or max() alone from the end of the primary key but scans for both
+    low, high = db.session.query(db.session.query(db.func.min(Item.id)).scalar_subquery(),
+                                 db.session.query(db.func.max(Item.id)).scalar_subquery()).one()
+    if high is None:
+        return []
+    sampled = []
+    for _ in range(rounds):
+        candidates = {random.randint(low, high) for _ in range(oversample * (n - len(sampled)))} - set(sampled)
+        # saved is checked in Python, otherwise SQLite may search the saved index instead of the primary key
+        rows = db.session.query(Item.id, Item.saved).filter(Item.id.in_(candidates), ~is_rated_by(user))
+        found = [row.id for row in rows if row.saved]
+        random.shuffle(found)
+        sampled += found[:n - len(sampled)]
+        if len(sampled) == n:
+            return sampled
+    rest = get_unrated_items_query(user).with_entities(Item.id)
+    if sampled:
+        rest = rest.filter(Item.id.notin_(sampled))
+    rest = rest.order_by(db.func.random()).limit(n - len(sampled))
+    return sampled + [row.id for row in rest]
+
+
+def get_ratings_by_user_and_name(user: User, name: str, per_page: int, after: tuple = None,
+                                 before: tuple = None) -> KeysetPage:
+    """
+    Returns a page of User's ratings of saved Items matching the name, ordered by relevance and by Item id.
+
+    :param user: User object that has ratings to be returned
+    :param name: string for name search query
+    :param per_page: number of items per page
+    :param after: key of the last Item of the previous page
+    :param before: key of the first Item of the next page
+    :return: KeysetPage object with (rating, Item) tuples, Items are rows with item_list_columns
+    """
+    query = db.session.query(*item_list_columns, RatingsAssoc.rating)\
+        .join(RatingsAssoc, RatingsAssoc.item_id == Item.id).filter(RatingsAssoc.user_id == user.id, Item.saved == True)
+    page = paginate_by_name(filter_by_name(query, Item, name), name, per_page, after, before)
+    page.items = [(row.rating, row) for row in page.items]
+    return page
+
+
+def get_rating_triples() -> list:
+    """
+    Returns all ratings without loading RatingsAssoc objects.
+
+    :return: list of (user_id, item_id, rating) tuples
+    """
+    return db.session.query(RatingsAssoc.user_id, RatingsAssoc.item_id, RatingsAssoc.rating).all()
+
+
 def get_ratings_count_by_user(user: User) -> int:
     """
     Returns ratings count.
@@ -354,18 +653,12 @@ def set_qty_in_meal(assoc: ItemProductAssoc, item: Item, new_qty: float) -> None
     :param new_qty: new quantity defined by editing user
     :return: None
     """
-    old_qty = assoc.qty
+    delta = new_qty - assoc.qty
     assoc.qty = new_qty
 
-    delta = assoc.qty - old_qty
-    old_item_qty = item.qty
-    item.qty = item.qty + delta
-
     # defining new macronutrient values per 100g
-    item.carb = (item.carb * old_item_qty + delta * assoc.product.carb) / item.qty
-    item.calories = (item.calories * old_item_qty + delta * assoc.product.calories) / item.qty
-    item.protein = (item.protein * old_item_qty + delta * assoc.product.protein) / item.qty
-    item.fat = (item.fat * old_item_qty + delta * assoc.product.fat) / item.qty
+    NutrientVector.of(item).mix(item.qty, NutrientVector.of(assoc.product), delta).apply_to(item)
+    item.qty = item.qty + delta
 
     db.session.commit()
 
@@ -382,10 +675,7 @@ def clear_meal(item: Item) -> None:
     while item.products:
         assoc = item.products.pop()
         db.session.delete(assoc)
-    item.calories = 0
-    item.carb = 0
-    item.protein = 0
-    item.fat = 0
+    NutrientVector().apply_to(item)
     item.qty = 0
     db.session.commit()
 
@@ -432,13 +722,9 @@ def add_product_to_meal(item: Item, product: Product, qty: float) -> None:
     assoc.product = product
     item.products.append(assoc)
 
-    old_item_qty = item.qty
-    item.qty += qty
     # defining new macronutrient values per 100g
-    item.carb = (item.carb * old_item_qty + product.carb * qty) / item.qty
-    item.protein = (item.protein * old_item_qty + product.protein * qty) / item.qty
-    item.fat = (item.fat * old_item_qty + product.fat * qty) / item.qty
-    item.calories = (item.calories * old_item_qty + product.calories * qty) / item.qty
+    NutrientVector.of(item).mix(item.qty, NutrientVector.of(product), qty).apply_to(item)
+    item.qty += qty
 
     db.session.commit()
 
@@ -463,10 +749,7 @@ def copy_meal(item: Item, copy_item: Item) -> None:
         new_a.qty = a.qty
         item.products.append(new_a)
 
-    item.carb = copy_item.carb
-    item.calories = copy_item.calories
-    item.protein = copy_item.protein
-    item.fat = copy_item.fat
+    NutrientVector.of(copy_item).apply_to(item)
     item.qty = copy_item.qty
     item.servings = copy_item.servings
     item.recipe = copy_item.recipe
@@ -485,19 +768,9 @@ def delete_index_from_meal(item: Item, assoc: ItemProductAssoc) -> None:
     :return: None
     """
     delta = -assoc.qty
-    old_item_qty = item.qty
+    # defining new macronutrient values per 100g, zero if the meal is left empty
+    NutrientVector.of(item).mix(item.qty, NutrientVector.of(assoc.product), delta).apply_to(item)
     item.qty = item.qty + delta
-    # defining new macronutrient values per 100g
-    if item.qty == 0:
-        item.carb = 0
-        item.calories = 0
-        item.fat = 0
-        item.protein = 0
-    else:
-        item.carb = (item.carb * old_item_qty + delta * assoc.product.carb) / item.qty
-        item.calories = (item.calories * old_item_qty + delta * assoc.product.calories) / item.qty
-        item.protein = (item.protein * old_item_qty + delta * assoc.product.protein) / item.qty
-        item.fat = (item.fat * old_item_qty + delta * assoc.product.fat) / item.qty
 
     item.products.remove(assoc)
     db.session.delete(assoc)
@@ -506,6 +779,97 @@ def delete_index_from_meal(item: Item, assoc: ItemProductAssoc) -> None:
     return None
 
 
+def get_items_containing_products_query(product_ids: list):
+    """
+    Returns query of ids of Items that contain any of the Products.
+
+    :param product_ids: ids of Products
+    :return: SQLAlchemy query of Item ids
+    """
+    return db.session.query(ItemProductAssoc.item_id).filter(ItemProductAssoc.product_id.in_(product_ids))
+
+
+def product_item_ids_query():
+    """
+    Returns query of ids of Items created together with Products (see add_product_to_db).
+
+    Such an Item consists of 100g of a single Product with the same name, and its qty keeps the weight per ea of the
+    Product instead of the total weight.
+
+    :return: SQLAlchemy query of Item ids
+    """
+    single = db.session.query(ItemProductAssoc.item_id).group_by(ItemProductAssoc.item_id)\
+        .having(db.func.count(ItemProductAssoc.id) == 1)
+    return db.session.query(ItemProductAssoc.item_id)\
+        .join(Item, ItemProductAssoc.item_id == Item.id).join(Product, ItemProductAssoc.product_id == Product.id)\
+        .filter(ItemProductAssoc.qty == 100, Item.name == Product.name, ItemProductAssoc.item_id.in_(single))
+
+
+def recompute_composed_items(product_ids: list = None, tolerance: float = 1e-9,
+                             chunk_size: int = MAX_IDS_PER_QUERY) -> list:
+    """
+    Recomputes quantity and nutrition values per 100g of composed Items from their Products.
+
+    Values of all Items are computed at once from a sparse Item x Product matrix of quantities. Only Items whose values
+    differ from the stored ones are updated, together with summaries of diets that contain them. Items created
+    together with Products (see product_item_ids_query) get new values per 100g, but keep their qty.
+
+    :param product_ids: ids of changed Products, only Items containing them are recomputed. Default None means all
+        composed Items.
+    :param tolerance: relative and absolute difference below which stored values are kept
+    :param chunk_size: maximum number of ids in a single query
+    :return: list of ids of updated Items
+    """
+    query = db.session.query(ItemProductAssoc.item_id, ItemProductAssoc.product_id, ItemProductAssoc.qty)\
+        .filter(ItemProductAssoc.item_id.isnot(None), ItemProductAssoc.product_id.isnot(None))
+    if product_ids is not None:
+        query = query.filter(ItemProductAssoc.item_id.in_(get_items_containing_products_query(product_ids)))
+    rows = np.array(query.all(), dtype=np.float64).reshape(-1, 3)
+    if not len(rows):
+        return []
+    item_ids, item_positions = np.unique(rows[:, 0].astype(np.int64), return_inverse=True)
+    used_product_ids, product_positions = np.unique(rows[:, 1].astype(np.int64), return_inverse=True)
+    weights = sparse.csr_matrix((rows[:, 2], (item_positions, product_positions)),
+                                shape=(len(item_ids), len(used_product_ids)))
+
+    products, _ = get_elements_in_order(Model.PRODUCT, used_product_ids.tolist(), columns=NUTRIENTS,
+                                        chunk_size=chunk_size)
+    values = np.zeros((len(used_product_ids), len(NUTRIENTS)))
+    values[np.searchsorted(used_product_ids, [product.id for product in products])] = to_matrix(products)
+    computed = np.column_stack((weighted_averages(weights, values), np.asarray(weights.sum(axis=1)).ravel()))
+
+    stored, _ = get_elements_in_order(Model.ITEM, item_ids.tolist(), columns=NUTRIENTS + ('qty',),
+                                      chunk_size=chunk_size)
+    positions = np.searchsorted(item_ids, [item.id for item in stored])
+    current = np.array([[value or 0 for value in item[1:]] for item in stored], dtype=np.float64)\
+        .reshape(-1, len(NUTRIENTS) + 1)
+    computed = computed[positions]
+    product_items = np.isin(item_ids[positions], [row.item_id for row in product_item_ids_query()])
+    computed[product_items, -1] = current[product_items, -1]
+    changed = ~np.isclose(current, computed, rtol=tolerance, atol=tolerance).all(axis=1)
+    changed_positions = positions[changed]
+    if not len(changed_positions):
+        return []
+
+    # changed Items are updated through the ORM, so that the item index and caches follow the new values
+    items, _ = get_elements_in_order(Model.ITEM, item_ids[changed_positions].tolist(), chunk_size=chunk_size)
+    new_values = dict(zip(item_ids[changed_positions].tolist(), computed[changed]))
+    for item in items:
+        NutrientVector.from_array(new_values[item.id][:len(NUTRIENTS)]).apply_to(item)
+        item.qty = float(new_values[item.id][-1])
+    changed_ids = [item.id for item in items]
+
+    diet_ids = set()
+    for start in range(0, len(changed_ids), chunk_size):
+        chunk = changed_ids[start:start + chunk_size]
+        diet_ids.update(row.diet_id for row in db.session.query(DietItemAssoc.diet_id)
+                        .filter(DietItemAssoc.item_id.in_(chunk)).distinct())
+    rebuild_day_summaries(diet_ids=sorted(diet_ids))
+    db.session.commit()
+
+    return changed_ids
+
+
 def add_diet(user: User, date: dt.date or str) -> DayDiet:
     """
     Creates a new DayDiet in database.
@@ -535,6 +899,7 @@ def copy_diet(diet: DayDiet, copied: DayDiet) -> None:
         new_a = DietItemAssoc(qty=a.qty)
         new_a.item = a.item
         diet.items.append(new_a)
+    update_day_summary(diet)
     db.session.commit()
 
     return None
@@ -566,6 +931,7 @@ def edit_item_qty_in_diet(assoc: DietItemAssoc, new_qty: float) -> None:
     :return: None
     """
     assoc.qty = new_qty
+    update_day_summary(db.session.get(DayDiet, assoc.diet_id))
     db.session.commit()
 
     return None
@@ -581,6 +947,7 @@ def delete_item_from_diet(assoc: DietItemAssoc, diet: DayDiet) -> None:
     """
     diet.items.remove(assoc)
     db.session.delete(assoc)
+    update_day_summary(diet)
     db.session.commit()
 
     return None
@@ -610,6 +977,7 @@ def add_item_to_diet(item: Item, qty: float, ea: int, diet: DayDiet) -> None:
         assoc = DietItemAssoc(qty=ea)
     assoc.item = item
     diet.items.append(assoc)
+    update_day_summary(diet)
     db.session.commit()
 
     return None
@@ -1,7 +1,11 @@
 import calendar
 import datetime as dt
-
-from mealswap.controllers.controls import get_diets_in_current_month
+from sqlalchemy import event, inspect
+from mealswap.cache import make_backend
+from mealswap.models.changes import ChangeTracker
+from mealswap.models.models import DayDiet, User
+from mealswap.controllers.controls import get_diet_days
+from mealswap.settings import CALENDAR_CACHE_URL, CALENDAR_CACHE_SIZE, CALENDAR_CACHE_TTL
 
 month_dict = {1: "January",
               2: "February",
@@ -16,63 +20,103 @@ month_dict = {1: "January",
               11: "November",
               12: "December"}
 
+# rendered calendars per (user, year, month), entries are removed when a diet in the month is added or deleted
+calendar_cache = make_backend(CALENDAR_CACHE_URL, max_size=CALENDAR_CACHE_SIZE, ttl=CALENDAR_CACHE_TTL)
+month_weeks = calendar.Calendar()
+
+
+def calendar_key(user_id: int, year: int, month: int) -> str:
+    """Returns cache key of the calendar."""
+    return f'calendar:{user_id}:{year}:{month}'
+
+
+def render_calendar(year: int, month: int, days: set) -> str:
+    """
+    Renders table rows of the month.
+
+    :param year: year of the month
+    :param month: number of the month
+    :param days: set of days of the month that have a diet
+    :return: HTML table rows, one row per week starting on Monday
+    """
+    rows = []
+    for week in month_weeks.monthdayscalendar(year, month):
+        cells = []
+        for day in week:
+            if day == 0:
+                cells.append("\t<td></td>\n")
+            else:
+                css_class = 'filled' if day in days else 'open'
+                cells.append(f'\t<td class="{css_class}">'
+                             f'<a href="/day/{year}-{month:02d}-{day:02d}">{day}</a>'
+                             f'</td>\n')
+        rows.append(f"<tr>\n{''.join(cells)}</tr>\n")
+    return ''.join(rows)
 
-def get_calendar():
-    """Creates a calendar widget for diet homepage."""
-
-    diets = get_diets_in_current_month()
-    days = [diet.date.day for diet in diets]
-
-    today = dt.date.today()
-    year = today.year
-    month = today.month
-    first_day = dt.date(year, month, 1)
-    last_day = dt.date(year, month, calendar.monthrange(year, month)[1])
-    first_day_weekday = first_day.weekday()
-
-    table_rows = "<tr>\n"
-    for _ in range(first_day_weekday):
-        table_rows += "\t<td></td>\n"
-    day_count = 1
-    for day in range(first_day_weekday, 7):
-        date = f'{year}-{month:02d}-{day_count:02d}'
-        if day_count in days:
-            table_rows += f'\t<td class="filled">' \
-                          f'<a href="/day/{date}">{day_count}</a>' \
-                          f'</td>\n'
-        else:
-            table_rows += f'\t<td class="open">' \
-                          f'<a href="/day/{date}">{day_count}</a>' \
-                          f'</td>\n'
-        day_count += 1
-    table_rows += "</tr>\n<tr>\n"
-
-    weekday_count = 1
-    while True:
-        date = f'{year}-{month:02d}-{day_count:02d}'
-        if day_count in days:
-            table_rows += f'\t<td class="filled">' \
-                          f'<a href="/day/{date}">{day_count}</a>' \
-                          f'</td>\n'
-        else:
-            table_rows += f'\t<td class="open">' \
-                          f'<a href="/day/{date}">{day_count}</a>' \
-                          f'</td>\n'
-        day_count += 1
-        weekday_count += 1
-        if day_count == last_day.day + 1:
-            break
-        if weekday_count == 8:
-            weekday_count = 1
-            table_rows += "</tr>\n<tr>\n"
-
-    while weekday_count < 8:
-        table_rows += "\t<td></td>\n"
-        weekday_count += 1
-    table_rows += "</tr>\n"
-
-    table_title = f"{month_dict[today.month]} {today.year}"
+
+def get_calendar(user: User, year: int, month: int) -> tuple:
+    """
+    Creates a calendar widget for diet homepage.
+
+    :param user: User whose diets are marked
+    :param year: year of the month
+    :param month: number of the month
+    :return: tuple of (title, HTML table rows)
+    """
+    key = calendar_key(user.id, year, month)
+    table_rows = calendar_cache.get(key)
+    if table_rows is None:
+        table_rows = render_calendar(year, month, get_diet_days(user, year, month))
+        calendar_cache.set(key, table_rows)
+
+    table_title = f"{month_dict[month]} {year}"
 
     return table_title, table_rows
 
 
+def neighbour_months(year: int, month: int) -> tuple:
+    """
+    Returns the previous and the next month.
+
+    :param year: year of the month
+    :param month: number of the month
+    :return: tuple of ((year, month) of the previous month, (year, month) of the next month)
+    """
+    previous = (year - 1, 12) if month == 1 else (year, month - 1)
+    following = (year + 1, 1) if month == 12 else (year, month + 1)
+    return previous, following
+
+
+def _apply_changes(changes: dict) -> None:
+    """Removes calendars of months changed in the committed transaction."""
+    for key in changes:
+        calendar_cache.delete(key)
+
+    return None
+
+
+calendar_changes = ChangeTracker('calendar', _apply_changes)
+
+
+def _record_diet(mapper, connection, target: DayDiet) -> None:
+    """Records month of the added, moved or deleted diet, so that its calendar can be removed after commit."""
+    dates = [target.date] + list(inspect(target).attrs.date.history.deleted or ())
+    for date in dates:
+        if isinstance(date, dt.date):
+            calendar_changes.record(target, calendar_key(target.user_id, date.year, date.month))
+
+    return None
+
+
+def init_calendar() -> None:
+    """
+    Registers events that remove cached calendars when diets are added or deleted.
+
+    :return: None
+    """
+    if not event.contains(DayDiet, 'after_insert', _record_diet):
+        event.listen(DayDiet, 'after_insert', _record_diet)
+        event.listen(DayDiet, 'after_update', _record_diet)
+        event.listen(DayDiet, 'after_delete', _record_diet)
+
+    return None
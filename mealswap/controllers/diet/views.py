@@ -1,9 +1,10 @@
 from flask import Blueprint, redirect, url_for, request, render_template, Response, flash
 from flask_login import login_required, current_user
-from mealswap.controllers.diet.helpers import get_calendar
+import datetime as dt
+from mealswap.controllers.diet.helpers import get_calendar, neighbour_months
 from mealswap.controllers.controls import Model, get_element_by_id, get_diet_by_date, add_diet, \
     delete_diet, edit_item_qty_in_diet, add_item_to_diet, get_saved_items_by_name, copy_diet, \
-    delete_item_from_diet, update_weight
+    delete_item_from_diet, update_weight, get_diet_totals, get_diet_items
 from mealswap.controllers.forms import DateForm, SearchForm, DeleteForm, EditForm, QtyEaForm, EaEditForm, WeightForm
 
 blueprint = Blueprint('diet', __name__, static_folder='../static')
@@ -22,9 +23,16 @@ def calendar() -> str or Response:
         date = date_form.date.data
         return redirect(url_for('diet.day', date=date))
 
-    title, table_rows = get_calendar()
+    today = dt.date.today()
+    year = request.args.get('year', today.year, type=int)
+    month = request.args.get('month', today.month, type=int)
+    if not (dt.MINYEAR < year < dt.MAXYEAR and 1 <= month <= 12):
+        year, month = today.year, today.month
+    title, table_rows = get_calendar(current_user, year, month)
+    previous, following = neighbour_months(year, month)
 
-    return render_template('diet/calendar.html', user=current_user, form=date_form, title=title, table_rows=table_rows)
+    return render_template('diet/calendar.html', user=current_user, form=date_form, title=title, table_rows=table_rows,
+                           previous=previous, following=following)
 
 
 @blueprint.route('/day/<date>', methods=['GET', 'POST'])
@@ -39,19 +47,11 @@ def day(date: str) -> str or Response:
     """
     diet = get_diet_by_date(date)
     total = {'calories': 0, 'protein': 0, 'carbs': 0, 'fat': 0}
+    items = []
 
     if diet:
-        for a in diet.items:
-            if a.item.has_weight:
-                total['calories'] += a.item.calories * a.qty / 100
-                total['protein'] += a.item.protein * a.qty / 100
-                total['carbs'] += a.item.carb * a.qty / 100
-                total['fat'] += a.item.fat * a.qty / 100
-            else:
-                total['calories'] += a.item.calories * a.qty
-                total['protein'] += a.item.protein * a.qty
-                total['carbs'] += a.item.carb * a.qty
-                total['fat'] += a.item.fat * a.qty
+        total = get_diet_totals(diet)
+        items = get_diet_items(diet)
 
     weight_form = WeightForm()
     if weight_form.validate_on_submit() and weight_form.submitWeightForm.data:
@@ -108,7 +108,7 @@ def day(date: str) -> str or Response:
         return redirect(url_for('diet.day', date=date))
 
     return render_template('diet/day.html',
-                           user=current_user, date=date, diet=diet, total=total, edit_form=edit_form,
+                           user=current_user, date=date, diet=diet, items=items, total=total, edit_form=edit_form,
                            date_form=copy_form, search_form=search_form, delete_form=delete_form,
                            ea_edit_form=ea_edit_form, weight_form=weight_form)
 
@@ -3,6 +3,7 @@ from wtforms import StringField, SubmitField, TextAreaField, DateField, DecimalF
     PasswordField, IntegerField
 from wtforms.validators import DataRequired, NumberRange, Optional, URL, Email, Length, EqualTo
 from mealswap.controllers.controls import get_user_by_email
+from mealswap.models.nutrients import calories_from_macros
 
 
 class ProductForm(FlaskForm):
@@ -387,7 +388,7 @@ class DietGoalMacroForm(FlaskForm):
             calories_check = 0
         else:
             calories_check = self.calories.data
-        if protein_check * 4 + carb_check * 4 + fat_check * 9 > calories_check:
+        if calories_from_macros(protein_check, carb_check, fat_check) > calories_check:
             self.calories.errors.append("Calories from macronutrients are bigger than goal calories. "
                                         "Please change one of them")
             return False
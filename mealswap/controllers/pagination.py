@@ -0,0 +1,112 @@
+"""Keyset (cursor) pagination of queries and ranked results"""
+import base64
+import json
+from flask import request
+from sqlalchemy import tuple_
+
+
+class KeysetPage:
+    """A class used to represent a page of results fetched after (or before) a cursor.
+
+    Unlike Pagination it does not know the number of results, only if there are neighbouring pages.
+    """
+
+    def __init__(self, items: list, has_prev: bool, has_next: bool, prev_cursor: str = None,
+                 next_cursor: str = None):
+        """
+        :param items: items of the page
+        :param has_prev: True if there is a previous page
+        :param has_next: True if there is a next page
+        :param prev_cursor: cursor of the previous page (the 'before' argument)
+        :param next_cursor: cursor of the next page (the 'after' argument)
+        """
+        self.items = items
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+
+def encode_cursor(key: tuple) -> str:
+    """
+    Encodes sort key of an item as an URL-safe cursor.
+
+    :param key: tuple of JSON-serializable values
+    :return: cursor string
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> tuple or None:
+    """
+    Decodes cursor created by encode_cursor.
+
+    :param cursor: cursor string
+    :return: sort key tuple or None if the cursor is missing or invalid
+    """
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        return None
+    return tuple(key) if isinstance(key, list) else None
+
+
+def get_cursors() -> tuple:
+    """Helper function for getting (after, before) cursor arguments."""
+    return decode_cursor(request.args.get('after')), decode_cursor(request.args.get('before'))
+
+
+def make_page(rows: list, per_page: int, key, after: tuple = None, before: tuple = None) -> KeysetPage:
+    """
+    Creates a page from rows fetched in the direction of paging.
+
+    :param rows: up to per_page + 1 rows, in reverse order if paging before a cursor
+    :param per_page: number of items per page
+    :param key: function returning sort key of a row
+    :param after: key of the last item of the previous page
+    :param before: key of the first item of the next page
+    :return: KeysetPage object
+    """
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = after is not None, has_more
+    prev_cursor = encode_cursor(key(rows[0])) if rows and has_prev else None
+    next_cursor = encode_cursor(key(rows[-1])) if rows and has_next else None
+    return KeysetPage(rows, has_prev, has_next, prev_cursor, next_cursor)
+
+
+def paginate_query(query, columns, per_page: int, after: tuple = None, before: tuple = None, key=None) -> KeysetPage:
+    """
+    Returns a page of query results ordered by a unique column (e.g. id) or columns unique together (e.g. relevance
+    and id).
+
+    Only per_page + 1 rows are fetched and the cursor is compared in SQL, so deep pages cost the same as the first.
+
+    :param query: SQLAlchemy query, its ordering is replaced
+    :param columns: unique column or tuple of columns results are ordered by
+    :param per_page: number of items per page
+    :param after: key of the last item of the previous page
+    :param before: key of the first item of the next page
+    :param key: function returning tuple of values of the columns for a row. Default None means (row.id,).
+    :return: KeysetPage object
+    """
+    columns = columns if isinstance(columns, tuple) else (columns,)
+    # cursors of a different ordering (e.g. created before full-text search was available) start from the first page
+    after = after if after is not None and len(after) == len(columns) else None
+    before = before if before is not None and len(before) == len(columns) else None
+    query = query.order_by(None)
+    if after is not None:
+        query = query.filter(tuple_(*columns) > tuple_(*after)).order_by(*columns)
+    elif before is not None:
+        query = query.filter(tuple_(*columns) < tuple_(*before)).order_by(*(column.desc() for column in columns))
+    else:
+        query = query.order_by(*columns)
+    rows = query.limit(per_page + 1).all()
+    key = key or (lambda row: (row.id,))
+    return make_page(rows, per_page, key, after, before)
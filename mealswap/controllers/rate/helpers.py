@@ -0,0 +1,42 @@
+from mealswap.cache import make_backend
+from mealswap.controllers.controls import Item, User, get_unrated_items_query, sample_unrated_item_ids
+from mealswap.settings import DISCOVER_QUEUE_URL, DISCOVER_QUEUE_SIZE, DISCOVER_QUEUE_TTL, RATE_PREFETCH
+
+# prefetched random unrated item ids per user, kept on the server instead of the session cookie
+discover_queue = make_backend(DISCOVER_QUEUE_URL, max_size=DISCOVER_QUEUE_SIZE, ttl=DISCOVER_QUEUE_TTL)
+
+
+def pop_unrated_item(user: User, item_ids: list) -> Item or None:
+    """
+    Takes ids from the end of the list until one of them is an Item that can still be rated by User.
+
+    :param user: User object that rates Items
+    :param item_ids: list of Item ids, modified in place
+    :return: Item object or None if the list has run out
+    """
+    while item_ids:
+        item = get_unrated_items_query(user).filter(Item.id == item_ids.pop()).first()
+        if item is not None:
+            return item
+    return None
+
+
+def next_item_to_rate(user: User, prefetch: int = RATE_PREFETCH) -> Item or None:
+    """
+    Returns a random saved Item that has not been rated by User.
+
+    The next prefetch random ids are drawn at once and queued, every queued id is checked again when it is taken,
+    since the Item could have been rated or deleted in the meantime.
+
+    :param user: User object that rates Items
+    :param prefetch: number of ids drawn when the queue runs out
+    :return: Item object or None if all saved Items have been rated
+    """
+    key = f'discover:{user.id}'
+    item_ids = discover_queue.get(key) or []
+    item = pop_unrated_item(user, item_ids)
+    if item is None:
+        item_ids = sample_unrated_item_ids(user, prefetch)
+        item = pop_unrated_item(user, item_ids)
+    discover_queue.set(key, item_ids)
+    return item
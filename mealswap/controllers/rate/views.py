@@ -1,10 +1,10 @@
-from flask import Blueprint, Response, redirect, url_for, render_template, request, flash, session
+from flask import Blueprint, Response, redirect, url_for, render_template, request, flash
 from flask_login import current_user, login_required
 from mealswap.controllers.forms import SearchForm, DiscoverForm
-from mealswap.controllers.controls import Model, get_element_by_id, get_element_list_by_ids, set_rating, \
-    get_saved_items, get_ratings_by_user, get_saved_items_by_name
-from random import randrange
-from mealswap.controllers.search.helpers import paginate_list
+from mealswap.controllers.controls import Model, get_element_by_id, set_rating, get_unrated_items
+from mealswap.controllers.pagination import get_cursors
+from .helpers import next_item_to_rate
+from mealswap.controllers.search.recommender import forget_predictions
 
 blueprint = Blueprint('rate', __name__, static_folder='../static')
 
@@ -38,15 +38,9 @@ def rate_search(searched) -> str:
     :param searched: string for saved items name query
     :return: rendered rate_search template
     """
-    page = request.args.get('page', 1, type=int)
+    after, before = get_cursors()
     per_page = 5
-    items_searched = get_saved_items_by_name(searched)
-    assoc_items_rated = get_ratings_by_user(current_user)
-
-    items_rated = [assoc.item for assoc in assoc_items_rated]
-    items = [item for item in items_searched if item not in items_rated]
-
-    pagination = paginate_list(items, page, per_page)
+    pagination = get_unrated_items(current_user, searched, per_page, after, before)
 
     return render_template('rate/rate_search.html', user=current_user, pagination=pagination, searched=searched)
 
@@ -58,24 +52,7 @@ def rate_discover():
 
     :return: rendered rate_discover template
     """
-    item_ids = session.get('rateable_items')  # get items if saved previously
-    item = None
-    if item_ids:
-        items = get_element_list_by_ids(Model.ITEM, item_ids)
-        if items:
-            item = items[randrange(len(items))]
-    else:
-        items = get_saved_items()
-        items_rated = get_ratings_by_user(current_user)
-        for assoc in items_rated:
-            try:
-                items.remove(assoc.item)
-            except ValueError:
-                continue
-        rateable_items = [item.id for item in items]
-        session['rateable_items'] = rateable_items  # saving for later
-        if len(rateable_items) > 0:
-            item = get_element_by_id(model=Model.ITEM, element_id=randrange(len(rateable_items)))
+    item = next_item_to_rate(current_user)
 
     return render_template('rate/rate_discover.html', user=current_user, item=item)
 
@@ -98,6 +75,9 @@ def rate_commit() -> Response:
     assoc = set_rating(item, current_user, rating)
     item_name = assoc.item.name
 
+    # predictions are ranked again with the new rating when discover is visited
+    forget_predictions(current_user)
+
     if edit:
         flash(message=f"Rating for: '{item_name}' successfully updated!", category="success")
         return redirect(url_for('edit.edit_ratings'))
@@ -105,5 +85,4 @@ def rate_commit() -> Response:
     if searched:
         return redirect(url_for('rate.rate_search', searched=searched))
     else:
-        session['rateable_items'] = session['rateable_items'].remove(int(item_id))
         return redirect(url_for('rate.rate_discover'))
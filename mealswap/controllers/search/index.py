@@ -0,0 +1,193 @@
+import threading
+import numpy as np
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from mealswap.models.models import Item
+from mealswap.models.changes import ChangeTracker, VersionCheck
+from mealswap.controllers.controls import get_saved_item_vectors, get_catalogue_version
+from mealswap.settings import INDEX_CHECK_TTL
+from .similarity import SimilarityEngine, COLUMNS
+
+
+class ItemIndex:
+    """A class used to keep macronutrient vectors of saved items in memory.
+
+    The index is built once when the app is created and then patched row by row by SQLAlchemy events on Item, so that
+    similarity searches and predictions do not have to read the whole item table on every request.
+    Changes are collected when the session flushes and applied only after the transaction is committed. Changes made
+    by other processes (workers, the importer) are noticed by a version check and the index is rebuilt.
+    """
+
+    def __init__(self, capacity: int = 1024, ttl: float = 10):
+        """
+        :param capacity: initial number of rows allocated for item vectors
+        :param ttl: minimum number of seconds between checks for changes made by other processes
+        """
+        self.lock = threading.RLock()
+        self.built = False
+        self.version = VersionCheck(get_catalogue_version, ttl)
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._matrix = np.zeros((capacity, len(COLUMNS)), dtype=np.float32)
+        self._positions = {}
+        self._engine = None
+
+    def __len__(self):
+        """Number of items in the index"""
+        return len(self._positions)
+
+    def __contains__(self, item_id: int):
+        """Checks if item with provided id is in the index"""
+        self.ensure_built()
+        return int(item_id) in self._positions
+
+    def build(self, rows: list = None) -> None:
+        """
+        (Re)builds the index from (id, protein, carb, fat, calories) rows.
+
+        :param rows: rows with item vectors. Default None means that saved items are read from the database
+        :return: None
+        """
+        if rows is None:
+            self.version.read()
+            rows = get_saved_item_vectors()
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(COLUMNS) + 1)
+        with self.lock:
+            capacity = max(1024, 2 * len(data))
+            self._ids = np.zeros(capacity, dtype=np.int64)
+            self._matrix = np.zeros((capacity, len(COLUMNS)), dtype=np.float32)
+            self._ids[:len(data)] = data[:, 0]
+            self._matrix[:len(data)] = data[:, 1:]
+            self._positions = {int(item_id): position for position, item_id in enumerate(data[:, 0])}
+            self._engine = None
+            self.built = True
+
+        return None
+
+    def ensure_built(self) -> None:
+        """
+        Builds the index if it has not been built yet (e.g. tables did not exist when the app was created) or if saved
+        items have been changed by another process.
+
+        :return: None
+        """
+        if not self.built or self.version.stale():
+            self.build()
+
+        return None
+
+    def upsert(self, item_id: int, vector: tuple) -> None:
+        """
+        Inserts or updates vector of a single item in place.
+
+        :param item_id: id of the item
+        :param vector: (protein, carb, fat, calories) values of the item
+        :return: None
+        """
+        with self.lock:
+            position = self._positions.get(item_id)
+            if position is None:
+                position = len(self._positions)
+                if position == len(self._ids):
+                    self._ids = np.concatenate((self._ids, np.zeros_like(self._ids)))
+                    self._matrix = np.concatenate((self._matrix, np.zeros_like(self._matrix)))
+                self._positions[item_id] = position
+                self._ids[position] = item_id
+            self._matrix[position] = vector
+            self._engine = None
+
+        return None
+
+    def remove(self, item_id: int) -> None:
+        """
+        Removes item from the index by moving the last row in its place.
+
+        :param item_id: id of the removed item
+        :return: None
+        """
+        with self.lock:
+            position = self._positions.pop(item_id, None)
+            if position is None:
+                return None
+            last = len(self._positions)
+            if position != last:
+                self._ids[position] = self._ids[last]
+                self._matrix[position] = self._matrix[last]
+                self._positions[int(self._ids[position])] = position
+            self._engine = None
+
+        return None
+
+    @property
+    def engine(self) -> SimilarityEngine:
+        """SimilarityEngine over a snapshot of the indexed vectors"""
+        self.ensure_built()
+        with self.lock:
+            if self._engine is None:
+                size = len(self._positions)
+                self._engine = SimilarityEngine(self._ids[:size].copy(), self._matrix[:size].copy())
+            return self._engine
+
+    def max_id(self) -> int:
+        """
+        Returns the highest id of an indexed item.
+
+        :return: highest item id or 0 if the index is empty
+        """
+        self.ensure_built()
+        with self.lock:
+            return int(self._ids[:len(self._positions)].max(initial=0))
+
+
+item_index = ItemIndex(ttl=INDEX_CHECK_TTL)
+
+
+def _apply_changes(changes: dict) -> None:
+    """Patches the index with Items changed in the committed transaction."""
+    if not item_index.built:
+        return None
+    for item_id, vector in changes.items():
+        if vector is not None:
+            item_index.upsert(item_id, vector)
+        else:
+            item_index.remove(item_id)
+
+    return None
+
+
+item_changes = ChangeTracker('item_index', _apply_changes)
+
+
+def _record_change(mapper, connection, target: Item) -> None:
+    """Records vector of changed Item, so that the index can be patched after commit."""
+    vector = (target.protein, target.carb, target.fat, target.calories) if target.saved else None
+    item_changes.record(target, target.id, vector)
+
+    return None
+
+
+def _record_delete(mapper, connection, target: Item) -> None:
+    """Records deleted Item, so that it can be removed from the index after commit."""
+    item_changes.record(target, target.id, None)
+
+    return None
+
+
+def init_index(app) -> None:
+    """
+    Builds the item index for the app and registers events that keep it current.
+
+    :param app: Flask app
+    :return: None
+    """
+    if not event.contains(Item, 'after_insert', _record_change):
+        event.listen(Item, 'after_insert', _record_change)
+        event.listen(Item, 'after_update', _record_change)
+        event.listen(Item, 'after_delete', _record_delete)
+    with app.app_context():
+        try:
+            item_index.build()
+        except OperationalError:
+            # tables have not been created yet - the index will be built on first use
+            item_index.built = False
+
+    return None
@@ -0,0 +1,435 @@
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+import numpy as np
+from scipy import sparse
+from scipy.optimize import minimize
+from mealswap.cache import make_backend
+from mealswap.settings import RECOMMENDER_MODEL_PATH, RECOMMENDATION_CACHE_URL, RECOMMENDATION_CACHE_SIZE, \
+    RECOMMENDATION_CACHE_TTL, RECOMMENDATION_COUNT
+from mealswap.controllers.controls import get_rating_triples, get_ratings_by_user
+from .index import item_index
+
+
+def build_ratings_matrix(ratings: np.ndarray, item_ids: np.ndarray = None) -> tuple:
+    """
+    Creates a compact sparse matrix of ratings.
+
+    Database ids are remapped to consecutive row/column numbers, so that the size of the matrix depends on the number
+    of rated items and users, not on the values of their ids.
+
+    :param ratings: array of (user_id, item_id, rating) rows
+    :param item_ids: additional item ids that should get a row even if they have not been rated
+    :return: tuple of (matrix Y of size (num_items, num_users) in COO format, item_ids, user_ids) where item_ids and
+    user_ids map rows and columns of Y back to database ids
+    """
+    ratings = np.asarray(ratings, dtype=np.int64).reshape(-1, 3)
+    user_ids, cols = np.unique(ratings[:, 0], return_inverse=True)
+    if item_ids is None:
+        item_ids = np.empty(0, dtype=np.int64)
+    item_ids = np.union1d(np.asarray(item_ids, dtype=np.int64), ratings[:, 1])
+    rows = np.searchsorted(item_ids, ratings[:, 1])
+    # keep a single rating for every item-user pair
+    _, unique = np.unique((rows * len(user_ids) + cols)[::-1], return_index=True)
+    unique = len(ratings) - 1 - unique
+    ratings, rows, cols = ratings[unique], rows[unique], cols[unique]
+    Y = sparse.coo_matrix((ratings[:, 2].astype(np.float64), (rows, cols)), shape=(len(item_ids), len(user_ids)))
+    return Y, item_ids, user_ids
+
+
+def errors(X: np.ndarray, Theta: np.ndarray, Y: sparse.coo_matrix) -> np.ndarray:
+    """
+    Returns prediction errors for the rated item-user pairs only.
+
+    :param X: matrix of item features
+    :param Theta: matrix of user features
+    :param Y: sparse matrix of ratings in COO format
+    :return: array of errors in the order of Y.data
+    """
+    return np.einsum('ij,ij->i', X[Y.row], Theta[Y.col]) - Y.data
+
+
+def f(params, num_users, num_items, num_features, Y, lambda_):
+    """Cost function for the collaborative filtering algorithm.
+
+    :param params: joined matrices of parameters describing user features and item features
+    :param num_users: number of users
+    :param num_items: number of items (meals)
+    :param num_features: number of features for each user/item
+    :param Y: sparse matrix of size (num_items, num_users) in COO format that stores rating for each rated item-user
+    pair
+    :param lambda_: regularization parameter (prevents overfitting)
+    """
+    params = np.reshape(params, (num_users + num_items, num_features))
+    X, Theta = np.split(params, [num_items])
+    cost = np.sum(errors(X, Theta, Y) ** 2) / 2 + lambda_ / 2 * (np.sum(Theta ** 2) + np.sum(X ** 2))
+    return cost
+
+
+def grad(params, num_users, num_items, num_features, Y, lambda_):
+    """Gradient function for the collaborative filtering algorithm.
+
+    :param params: joined matrices of parameters describing user features and item features
+    :param num_users: number of users
+    :param num_items: number of items (meals)
+    :param num_features: number of features for each user/item
+    :param Y: sparse matrix of size (num_items, num_users) in COO format that stores rating for each rated item-user
+    pair
+    :param lambda_: regularization parameter (prevents overfitting)
+    """
+    params = np.reshape(params, (num_users + num_items, num_features))
+    X, Theta = np.split(params, [num_items])
+    E = sparse.csr_matrix((errors(X, Theta, Y), (Y.row, Y.col)), shape=Y.shape)
+    X_grad = E @ Theta + lambda_ * X
+    Theta_grad = E.T @ X + lambda_ * Theta
+    g = np.concatenate((X_grad, Theta_grad))
+    g = g.flatten()
+    return g
+
+
+def solve_ridge(A: sparse.csr_matrix, F: np.ndarray, lambda_: float) -> np.ndarray:
+    """
+    Solves the ridge regression (F_r^T F_r + lambda I) x = F_r^T a_r in closed form for every row a of A, where F_r
+    are the rows of F for the rated columns of a. Rows without ratings get zero features.
+
+    :param A: sparse matrix of ratings in CSR format
+    :param F: matrix of fixed features for the columns of A
+    :param lambda_: regularization parameter (prevents overfitting)
+    :return: matrix of features for the rows of A
+    """
+    num_features = F.shape[1]
+    result = np.zeros((A.shape[0], num_features))
+    rated = np.flatnonzero(np.diff(A.indptr))
+    if len(rated) == 0:
+        return result
+    starts = A.indptr[rated]
+    F_rated = F[A.indices]
+    gram = np.add.reduceat(F_rated[:, :, None] * F_rated[:, None, :], starts, axis=0)
+    gram += lambda_ * np.eye(num_features)
+    rhs = np.add.reduceat(F_rated * A.data[:, None], starts, axis=0)
+    result[rated] = np.linalg.solve(gram, rhs[:, :, None])[:, :, 0]
+    return result
+
+
+def solve_ridge_parallel(A: sparse.csr_matrix, F: np.ndarray, lambda_: float, executor: ProcessPoolExecutor = None,
+                         chunk_size: int = 50000) -> np.ndarray:
+    """
+    Runs solve_ridge on chunks of rows of A, in parallel if an executor is provided.
+
+    Chunks bound the memory of the per-row Gram matrices (ratings x features x features), so A is split even when
+    the chunks are solved in the current process.
+
+    :param A: sparse matrix of ratings in CSR format
+    :param F: matrix of fixed features for the columns of A
+    :param lambda_: regularization parameter (prevents overfitting)
+    :param executor: process pool used to solve the chunks, None to solve them in the current process
+    :param chunk_size: approximate number of ratings in a chunk
+    :return: matrix of features for the rows of A
+    """
+    if A.nnz <= chunk_size:
+        return solve_ridge(A, F, lambda_)
+    bounds = np.searchsorted(A.indptr, np.arange(chunk_size, A.nnz, chunk_size))
+    bounds = np.unique(np.concatenate(([0], bounds, [A.shape[0]])))
+    chunks = [A[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    solve = executor.map if executor is not None else map
+    return np.concatenate(list(solve(solve_ridge, chunks, repeat(F), repeat(lambda_))))
+
+
+def train_als(Y: sparse.coo_matrix, X: np.ndarray, Theta: np.ndarray, lambda_: float, iterations: int = 20,
+              tol: float = 1e-4, workers: int = None) -> tuple:
+    """
+    Fits the collaborative filtering model with alternating least squares.
+
+    Every sweep solves user features with fixed item features and then item features with fixed user features.
+    Training stops when the relative change of the cost is lower than tol.
+
+    :param Y: sparse matrix of size (num_items, num_users) in COO format with ratings
+    :param X: initial item features
+    :param Theta: initial user features
+    :param lambda_: regularization parameter (prevents overfitting)
+    :param iterations: maximum number of sweeps
+    :param tol: relative change of the cost that stops the training
+    :param workers: number of worker processes, None for all cores, 1 to train in the current process
+    :return: tuple of (X, Theta, number of sweeps)
+    """
+    num_items, num_users = Y.shape
+    num_features = X.shape[1]
+    Y_items = Y.tocsr()
+    Y_users = Y.T.tocsr()
+    cost = f(np.concatenate((X, Theta)).flatten(), num_users, num_items, num_features, Y, lambda_)
+    executor = ProcessPoolExecutor(max_workers=workers) if workers != 1 else None
+    sweep = 0
+    try:
+        for sweep in range(1, iterations + 1):
+            Theta = solve_ridge_parallel(Y_users, X, lambda_, executor)
+            X = solve_ridge_parallel(Y_items, Theta, lambda_, executor)
+            new_cost = f(np.concatenate((X, Theta)).flatten(), num_users, num_items, num_features, Y, lambda_)
+            converged = cost - new_cost <= tol * max(new_cost, 1e-12)
+            cost = new_cost
+            if converged:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return X, Theta, sweep
+
+
+def initial_factors(ids: np.ndarray, num_features: int, previous_ids: np.ndarray = None,
+                    previous: np.ndarray = None) -> np.ndarray:
+    """
+    Creates initial features, reusing features of a previously trained model (warm start) where available.
+
+    :param ids: database ids of the rows
+    :param num_features: number of features for each row
+    :param previous_ids: database ids of the rows of the previous model
+    :param previous: features of the previous model
+    :return: matrix of initial features
+    """
+    factors = np.random.rand(len(ids), num_features)
+    if previous is not None and previous.shape[1] == num_features:
+        _, new_rows, old_rows = np.intersect1d(ids, previous_ids, assume_unique=True, return_indices=True)
+        factors[new_rows] = previous[old_rows]
+    return factors
+
+
+def train_model(num_features: int = 10, lambda_: float = 10, method: str = 'newton-cg', iterations: int = 20,
+                workers: int = None, warm_start: bool = True) -> dict:
+    """
+    Fits the collaborative filtering model on all ratings in the database.
+
+    :param num_features: number of features for each user/item
+    :param lambda_: regularization parameter (prevents overfitting)
+    :param method: 'newton-cg' to minimize the cost function with scipy, 'als' for alternating least squares
+    :param iterations: maximum number of ALS sweeps
+    :param workers: number of ALS worker processes, None for all cores
+    :param warm_start: if True, training starts from the factors of the saved model
+    :return: dictionary with item factors X, user factors Theta and their item_ids/user_ids mappings
+    """
+    Y, item_ids, user_ids = build_ratings_matrix(get_rating_triples(), item_index.engine.ids)
+    # initiate dimensions
+    num_items, num_users = Y.shape
+
+    # create matrices with initial parameters
+    previous = load_model() if warm_start else None
+    if previous:
+        X = initial_factors(item_ids, num_features, previous['item_ids'], previous['X'])
+        Theta = initial_factors(user_ids, num_features, previous['user_ids'], previous['Theta'])
+    else:
+        X = initial_factors(item_ids, num_features)
+        Theta = initial_factors(user_ids, num_features)
+
+    if method == 'als':
+        X, Theta, _ = train_als(Y, X, Theta, lambda_, iterations=iterations, workers=workers)
+    else:
+        initial_parameters = np.concatenate((X, Theta))
+        initial_parameters = initial_parameters.flatten()
+
+        # run minimization
+        result = minimize(f, initial_parameters, args=(num_users, num_items, num_features, Y, lambda_),
+                          method='Newton-CG', jac=grad)
+
+        # retrieve original matrices from flattened result
+        result = np.reshape(result.x, (num_users + num_items, num_features))
+        X, Theta = np.split(result, [num_items])
+
+    return {'X': X, 'Theta': Theta, 'item_ids': item_ids, 'user_ids': user_ids, 'lambda_': lambda_}
+
+
+def load_model(path: str = RECOMMENDER_MODEL_PATH) -> dict or None:
+    """
+    Loads the model saved by save_model.
+
+    :param path: path of the model file
+    :return: dictionary with the model arrays or None if the model has not been saved yet
+    """
+    try:
+        with np.load(path) as data:
+            return {key: data[key] for key in data.files}
+    except FileNotFoundError:
+        return None
+
+
+def save_model(model: dict, path: str = RECOMMENDER_MODEL_PATH) -> None:
+    """
+    Saves the model to an .npz file. The file is replaced atomically, so that running app never reads a partial file.
+
+    :param model: dictionary returned by train_model
+    :param path: path of the model file
+    :return: None
+    """
+    tmp_path = f'{path}.tmp.npz'
+    np.savez(tmp_path, version=np.int64(time.time() * 1000), **model)
+    os.replace(tmp_path, path)
+
+    return None
+
+
+class TrainedModel:
+    """A class that holds one loaded model file and serves predictions from it.
+
+    Arrays of the model are never changed after loading. A newer model file is loaded into a new object, so a request
+    that has taken a model keeps using consistent arrays even if the file is reloaded in the meantime.
+    """
+    __slots__ = ('X', 'Theta', 'item_ids', 'user_positions', 'version', 'lambda_')
+
+    def __init__(self, data):
+        """
+        :param data: arrays of the model returned by load_model
+        """
+        self.X = data['X']
+        self.Theta = data['Theta']
+        self.item_ids = data['item_ids']
+        self.user_positions = {int(user_id): i for i, user_id in enumerate(data['user_ids'])}
+        self.version = int(data['version'])
+        self.lambda_ = float(data['lambda_']) if 'lambda_' in data else 10
+
+    def user_vector(self, user_id: int) -> np.ndarray:
+        """
+        Returns trained features of the user, users that are not in the model get the mean features of all users.
+
+        :param user_id: id of the user
+        :return: array of user features
+        """
+        position = self.user_positions.get(user_id)
+        if position is None:
+            return self.Theta.mean(axis=0) if len(self.Theta) else np.zeros(self.X.shape[1])
+        return self.Theta[position]
+
+    def fold_in(self, user_id: int, ratings: list) -> np.ndarray:
+        """
+        Re-solves features of a single user from their current ratings, holding item features fixed.
+
+        If none of the rated items are in the model (e.g. they have been created after training), trained (or mean)
+        features of the user are returned.
+
+        :param user_id: id of the user
+        :param ratings: list of (item_id, rating) tuples of the user
+        :return: array of user features
+        """
+        ratings = np.asarray(ratings, dtype=np.float64).reshape(-1, 2)
+        positions = np.searchsorted(self.item_ids, ratings[:, 0]).clip(max=len(self.item_ids) - 1)
+        known = self.item_ids[positions] == ratings[:, 0]
+        if not known.any():
+            return self.user_vector(user_id)
+        F = self.X[positions[known]]
+        A = F.T @ F + self.lambda_ * np.eye(self.X.shape[1])
+        return np.linalg.solve(A, F.T @ ratings[known, 1])
+
+    def predict(self, features: np.ndarray, rated_ids: list, available_ids: np.ndarray, n: int) -> np.ndarray:
+        """
+        Scores all items for a single user with one matrix-vector product and returns the best of them.
+
+        Only the n best items are sorted, items with equal predictions are ordered by id.
+
+        :param features: array of user features, e.g. returned by fold_in
+        :param rated_ids: ids of items already rated by the user, left out of the results
+        :param available_ids: ids of items that can be recommended, other items of the model are left out
+        :param n: maximum number of returned items
+        :return: int32 array of up to n item ids ordered from the highest predicted rating
+        """
+        predictions = self.X @ features
+        keep = np.flatnonzero(np.isin(self.item_ids, available_ids) & ~np.isin(self.item_ids, rated_ids))
+        n = min(n, len(keep))
+        if n == 0:
+            return np.empty(0, dtype=np.int32)
+        scores = -predictions[keep]
+        # take every item tied with the n-th prediction, so that the result does not depend on partition order
+        threshold = scores[np.argpartition(scores, n - 1)[n - 1]]
+        best = keep[scores <= threshold]
+        order = np.lexsort((self.item_ids[best], -predictions[best]))[:n]
+        return self.item_ids[best[order]].astype(np.int32)
+
+
+class Recommender:
+    """A class used to serve predictions of the collaborative filtering model trained offline.
+
+    The model file is loaded lazily on first use and reloaded when it is replaced by a newer training run. The loaded
+    model is published as one TrainedModel object, so readers never see arrays of two different files.
+    """
+
+    def __init__(self, path: str = RECOMMENDER_MODEL_PATH):
+        """
+        :param path: path of the model file
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.mtime = None
+        self.model = None
+
+    def load(self) -> TrainedModel or None:
+        """
+        Loads the model file if it has not been loaded yet or if it has changed on disk.
+
+        :return: TrainedModel object or None if no model is available
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return self.model
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    self.model = TrainedModel(load_model(self.path))
+                    self.mtime = mtime
+        return self.model
+
+
+recommender = Recommender()
+# int32 arrays of the best ranked item ids per user and model version
+prediction_cache = make_backend(RECOMMENDATION_CACHE_URL, max_size=RECOMMENDATION_CACHE_SIZE,
+                                ttl=RECOMMENDATION_CACHE_TTL)
+
+
+def predict_for_user(user, model: TrainedModel) -> list:
+    """
+    Scores items for the user with the loaded model and caches the result.
+
+    Current ratings of the user are folded into the model first, so predictions follow ratings added after training.
+    Only the RECOMMENDATION_COUNT best items are kept.
+
+    :param user: User that gets the predictions
+    :param model: TrainedModel object returned by recommender.load
+    :return: int32 array of item ids
+    """
+    ratings = [(assoc.item_id, assoc.rating) for assoc in get_ratings_by_user(user)]
+    features = model.fold_in(user.id, ratings) if len(model.item_ids) else model.user_vector(user.id)
+    # only saved items that still exist (a meal could have been deleted after training)
+    predicted = model.predict(features, [item_id for item_id, _ in ratings], item_index.engine.ids,
+                              RECOMMENDATION_COUNT)
+    prediction_cache.set(f'predictions:{user.id}:{model.version}', predicted)
+    return predicted
+
+
+def forget_predictions(user) -> None:
+    """
+    Removes cached predictions of the user, so that the next request ranks items again with the user's new ratings.
+
+    :param user: User that has rated an Item
+    :return: None
+    """
+    model = recommender.load()
+    if model is not None:
+        prediction_cache.delete(f'predictions:{user.id}:{model.version}')
+
+    return None
+
+
+def get_predictions(user) -> list:
+    """
+    Returns a list of ids of saved items that the user has not rated yet, ordered by predicted rating.
+
+    Predictions are served from the cache if the user has already got them from the current model. The model is never
+    trained while serving a request - until `flask train_recommender` has saved one, there are no predictions.
+
+    :param user: User that gets the predictions
+    :return: list of up to RECOMMENDATION_COUNT item ids, empty if no model has been trained yet
+    """
+    model = recommender.load()
+    if model is None:
+        return []
+    predicted = prediction_cache.get(f'predictions:{user.id}:{model.version}')
+    if predicted is None:
+        predicted = predict_for_user(user, model)
+    return predicted.tolist()
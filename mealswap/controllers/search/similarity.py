@@ -0,0 +1,116 @@
+import numpy as np
+
+# order of the macronutrient columns in the item matrix
+COLUMNS = ('protein', 'carb', 'fat', 'calories')
+
+
+class SimilarityEngine:
+    """A class used to score items by cosine similarity of their macronutrient vectors.
+
+    Item vectors are kept in a contiguous (n_items, 4) float32 matrix with columns defined in COLUMNS. Queries with
+    missing macronutrient values are handled with a column mask, norms of the item vectors are computed once per mask
+    and reused by later queries.
+    """
+
+    def __init__(self, ids: np.ndarray, matrix: np.ndarray):
+        """
+        :param ids: array of item ids, one for each row of the matrix
+        :param matrix: array of size (n_items, 4) with macronutrient values of the items
+        """
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32).reshape(-1, len(COLUMNS))
+        self.squares = self.matrix * self.matrix
+        self._norms = {}
+
+    def __len__(self):
+        """Number of items in the engine"""
+        return len(self.ids)
+
+    def norms(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Returns norms of the item vectors reduced to the masked columns.
+
+        :param mask: float32 array of size 4 with 1 for every column taken into account and 0 otherwise
+        :return: array of norms, one for every item
+        """
+        key = mask.tobytes()
+        if key not in self._norms:
+            self._norms[key] = np.sqrt(self.squares @ mask)
+        return self._norms[key]
+
+    def cosines(self, protein: float or None, carb: float or None, fat: float or None,
+                calories: float or None) -> np.ndarray:
+        """
+        Scores all items against the query with one matrix-vector product.
+
+        Macronutrients that are None are left out of the comparison. Items that cannot be compared (zero vectors, or
+        every item if the query itself is zero) get a score of -inf and are never returned by page.
+
+        :param protein: protein content of the query
+        :param carb: carb content of the query
+        :param fat: fat content of the query
+        :param calories: calories of the query
+        :return: array of cosine similarities, one for every item
+        """
+        values = (protein, carb, fat, calories)
+        mask = np.array([v is not None for v in values], dtype=np.float32)
+        query = np.array([v or 0 for v in values], dtype=np.float32)
+        cosines = np.full(len(self), -np.inf, dtype=np.float32)
+        if not query.any():
+            return cosines
+        denominator = self.norms(mask) * np.sqrt(np.dot(query, query))
+        comparable = denominator > 0
+        np.divide(self.matrix @ query, denominator, out=cosines, where=comparable)
+        # only comparable items are clipped, clipping -inf would turn them into the worst match
+        np.clip(cosines, -1, 1, out=cosines, where=comparable)
+        return cosines
+
+    def page(self, cosines: np.ndarray, per_page: int, after: tuple = None, before: tuple = None,
+             exclude_id: int = None) -> list:
+        """
+        Returns a page of the best scored items that follows (or precedes) a cursor.
+
+        Items are ordered by descending cosine and then by id, a cursor is the (cosine, id) key of the last (or first)
+        item of the neighbouring page. Only per_page + 1 items are selected, so deep pages cost the same as the first;
+        the extra item tells if there are more items in the direction of paging.
+
+        :param cosines: array of scores returned by cosines
+        :param per_page: number of items per page
+        :param after: key of the last item of the previous page
+        :param before: key of the first item of the next page
+        :param exclude_id: id of the item that should be left out of the results
+        :return: list of up to per_page + 1 (similarity, item id, cosine) tuples, in reverse order if paging before
+        the cursor
+        """
+        valid = self._valid(cosines, exclude_id)
+        scores, ids = cosines[valid], self.ids[valid]
+        if after is not None:
+            valid = valid[(scores < after[0]) | ((scores == after[0]) & (ids > after[1]))]
+        elif before is not None:
+            valid = valid[(scores > before[0]) | ((scores == before[0]) & (ids < before[1]))]
+        return self._rows(cosines, self._best(cosines, valid, per_page + 1, reverse=before is not None))
+
+    def _valid(self, cosines: np.ndarray, exclude_id: int = None) -> np.ndarray:
+        """Returns positions of items that could be compared, without the excluded item."""
+        if exclude_id is not None:
+            cosines = np.where(self.ids == int(exclude_id), np.float32(-np.inf), cosines)
+        return np.flatnonzero(cosines > -np.inf)
+
+    def _best(self, cosines: np.ndarray, positions: np.ndarray, k: int, reverse: bool = False) -> np.ndarray:
+        """Returns k of the positions ordered by descending cosine and ascending id (or the opposite if reverse)."""
+        k = min(k, len(positions))
+        if k == 0:
+            return positions[:0]
+        sign = 1 if reverse else -1
+        scores = sign * cosines[positions]
+        # take every candidate tied with the k-th score, so that page boundaries do not depend on partition order
+        threshold = scores[np.argpartition(scores, k - 1)[k - 1]]
+        candidates = positions[scores <= threshold]
+        order = np.lexsort((-sign * self.ids[candidates], sign * cosines[candidates]))[:k]
+        return candidates[order]
+
+    def _rows(self, cosines: np.ndarray, positions: np.ndarray) -> list:
+        """Returns (similarity, item id, cosine) tuples for the positions."""
+        values = cosines[positions]
+        similarity = 1 - np.arccos(values.astype(np.float64)) * 2 / np.pi
+        return list(zip(similarity.tolist(), self.ids[positions].tolist(), values.tolist()))
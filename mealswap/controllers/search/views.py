@@ -1,10 +1,11 @@
-import sqlalchemy.exc
 from flask import Blueprint, render_template, Response, redirect, url_for, request, flash, session
 from flask_login import current_user, login_required
 from mealswap.controllers.forms import SearchForm, MacroForm, DiscoverForm, DateQtyEaForm
-from mealswap.controllers.controls import get_element_by_id, Model, get_saved_items_by_name, get_saved_items, \
-    get_diet_by_date, add_diet, add_item_to_diet, get_element_list_by_ids
-from .helpers import get_float, get_similar_items, get_predictions, paginate_list
+from mealswap.controllers.controls import get_element_by_id, Model, get_saved_items_by_name, \
+    get_diet_by_date, add_diet, add_item_to_diet, get_elements_in_order
+from mealswap.controllers.pagination import get_cursors
+from .helpers import get_float, get_similar_items, paginate_list
+from .recommender import get_predictions
 
 blueprint = Blueprint('search', __name__, static_folder='../static')
 
@@ -67,16 +68,14 @@ def search_macro() -> str or Response:
         redirect to search_macro if adding form has not passed validation OR
         redirect to diet if item successfully added
     """
-    items = get_saved_items()
     item_id = request.args.get('item_id', default=None)
-    page = request.args.get('page', 1, type=int)
+    after, before = get_cursors()
     per_page = 5
 
     # accessing page by choosing an existing item
     if item_id:
         item = get_element_by_id(Model.ITEM, item_id)
         name = item.name
-        items.remove(item)
         protein = item.protein
         carb = item.carb
         fat = item.fat
@@ -89,8 +88,7 @@ def search_macro() -> str or Response:
         fat = get_float('fat')
         calories = get_float('calories')
 
-    similarity_list = get_similar_items(items, protein, carb, fat, calories, item_id)
-    pagination = paginate_list(similarity_list, page, per_page)
+    pagination = get_similar_items(protein, carb, fat, calories, item_id, per_page, after, before)
 
     form = DateQtyEaForm()
     if request.method == 'POST':
@@ -136,7 +134,7 @@ def search_macro() -> str or Response:
 
     return render_template('search/search_macro.html',
                            user=current_user, pagination=pagination, form=form, item_id=item_id,
-                           name=name, protein=protein, carb=carb, fat=fat, calories=calories, page=page)
+                           name=name, protein=protein, carb=carb, fat=fat, calories=calories)
 
 
 @blueprint.route("/search/discover", methods=['GET', 'POST'])
@@ -148,15 +146,12 @@ def search_discover() -> str or Response:
         redirect to search_discover if adding form has not passed validation OR
         redirect to diet item successfully added
     """
-    page = request.args.get('page', 1, type=int)
+    # the session keeps only the cursor (page) - ranked items are cached on the server
+    page = request.args.get('page', session.get('discover_page', 1), type=int)
+    session['discover_page'] = page
     per_page = 5
-    try:
-        items = get_element_list_by_ids(Model.ITEM, session.get('prediction_items'),
-                                        paginate=True, page=page, per_page=per_page)
-    except sqlalchemy.exc.ArgumentError:
-        items = get_predictions(current_user)
-        prediction_items = [item.id for item in items]
-        session['prediction_items'] = prediction_items
+    items = paginate_list(get_predictions(current_user), page, per_page)
+    items.items, _ = get_elements_in_order(Model.ITEM, items.items)
 
     form = DateQtyEaForm()
     if request.method == 'POST':
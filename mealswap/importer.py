@@ -0,0 +1,295 @@
+"""Streaming import of meals and products from CSV files"""
+import csv
+import hashlib
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count, islice
+from mealswap.extensions import db
+from mealswap.models.models import Item, Product, ItemProductAssoc
+from mealswap.models.fulltext import insert_names
+from mealswap.models.nutrients import calories_from_macros
+
+
+class Checkpoint:
+    """A class used to remember how many rows of a file have been imported, so that a failed import can be resumed."""
+
+    def __init__(self, file: str):
+        """
+        :param file: path of the imported file, the checkpoint is stored next to it
+        """
+        self.path = file + '.progress'
+
+    def load(self) -> int:
+        """
+        Returns number of rows imported before.
+
+        :return: number of rows, 0 if there is no checkpoint
+        """
+        try:
+            with open(self.path) as checkpoint:
+                return int(checkpoint.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def save(self, rows: int) -> None:
+        """
+        Stores number of imported rows.
+
+        :param rows: number of rows committed to the database
+        :return: None
+        """
+        with open(self.path + '.tmp', 'w') as checkpoint:
+            checkpoint.write(str(rows))
+        os.replace(self.path + '.tmp', self.path)
+
+        return None
+
+    def clear(self) -> None:
+        """
+        Removes the checkpoint after a finished import.
+
+        :return: None
+        """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        return None
+
+
+def read_batches(file: str, batch_size: int, skip: int = 0):
+    """
+    Reads rows of a CSV file in batches without loading the whole file.
+
+    :param file: path of the CSV file with a header line
+    :param batch_size: number of rows in a batch
+    :param skip: number of rows to be skipped (already imported)
+    :return: generator of lists of rows (dictionaries keyed by column names)
+    """
+    with open(file, 'r', newline='') as csvfile:
+        reader = islice(csv.DictReader(csvfile), skip, None)
+        while True:
+            batch = list(islice(reader, batch_size))
+            if not batch:
+                return
+            yield batch
+
+
+def next_id(model) -> int:
+    """
+    Returns the first free id of the model table.
+
+    :param model: SQLAlchemy model
+    :return: id following the highest id in the table
+    """
+    return (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+
+
+def row_key(name: str, protein: float, carb: float, fat: float) -> int:
+    """
+    Returns deduplication key of a row: 64-bit hash of the normalized name and macronutrients rounded to 0.01 g.
+
+    :param name: name of the meal or product
+    :param protein: protein content
+    :param carb: carb content
+    :param fat: fat content
+    :return: hash of the row
+    """
+    normalized = f"{' '.join(name.lower().split())}|{protein:.2f}|{carb:.2f}|{fat:.2f}"
+    return int.from_bytes(hashlib.blake2b(normalized.encode(), digest_size=8).digest(), 'little')
+
+
+def validate_row(row: dict) -> dict:
+    """
+    Validates a CSV row and converts it to column values.
+
+    :param row: row with name, protein, carbohydrates, fat and (optionally) link columns
+    :return: dictionary with name, protein, carb, fat, calories, link and key keys
+    :raises ValueError: if the row is invalid
+    """
+    name = (row.get('name') or '').strip()
+    if not name or len(name) > 250:
+        raise ValueError('name has to have 1 to 250 characters')
+    values = {}
+    for column, key in (('protein', 'protein'), ('carbohydrates', 'carb'), ('fat', 'fat')):
+        try:
+            value = float(row.get(column))
+        except (TypeError, ValueError):
+            raise ValueError(f'{column} is not a number')
+        if not math.isfinite(value) or value < 0:
+            raise ValueError(f'{column} has to be a non-negative number')
+        values[key] = value
+    link = (row.get('link') or '').strip() or None
+    if link is not None and len(link) > 250:
+        raise ValueError('link has to have at most 250 characters')
+    return dict(values, name=name, link=link,
+                calories=calories_from_macros(values['protein'], values['carb'], values['fat']),
+                key=row_key(name, values['protein'], values['carb'], values['fat']))
+
+
+def validate_batch(batch: list, first_line: int) -> tuple:
+    """
+    Validates a batch of CSV rows, runs in worker processes.
+
+    :param batch: list of rows
+    :param first_line: line number of the first row in the file
+    :return: tuple of (list of valid values, list of (line number, error message) tuples, number of rows)
+    """
+    valid, errors = [], []
+    for line, row in enumerate(batch, start=first_line):
+        try:
+            valid.append(validate_row(row))
+        except ValueError as error:
+            errors.append((line, str(error)))
+    return valid, errors, len(batch)
+
+
+def validated_batches(file: str, batch_size: int, skip: int = 0, workers: int = None):
+    """
+    Reads and validates batches of a CSV file, in a process pool if workers is not 0.
+
+    At most two batches per worker are read ahead, so memory use stays bounded; results keep the order of the file.
+
+    :param file: path of the CSV file
+    :param batch_size: number of rows in a batch
+    :param skip: number of rows to be skipped (already imported)
+    :param workers: number of worker processes. Default None means all cores, 0 means validation in this process.
+    :return: generator of validate_batch results
+    """
+    # line 1 is the header
+    lines = count(skip + 2, batch_size)
+    if workers == 0:
+        for batch, first_line in zip(read_batches(file, batch_size, skip), lines):
+            yield validate_batch(batch, first_line)
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for batch, first_line in zip(read_batches(file, batch_size, skip), lines):
+            pending.append(executor.submit(validate_batch, batch, first_line))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def existing_keys(model, batch_size: int = 10000) -> set:
+    """
+    Builds the deduplication index of rows already stored in the database.
+
+    :param model: Product, or Item for saved meals
+    :param batch_size: number of rows fetched at once
+    :return: set of row keys
+    """
+    query = db.session.query(model.name, model.protein, model.carb, model.fat)
+    if model is Item:
+        query = query.filter(Item.saved == True)
+    return {row_key(*row) for row in query.yield_per(batch_size)}
+
+
+def insert_meals(values: list, user_id: int) -> None:
+    """
+    Inserts meals (saved Items per ea) with one executemany statement.
+
+    :param values: validated rows
+    :param user_id: id of the User adding the meals
+    :return: None
+    """
+    first_id = next_id(Item)
+    items = [{'id': first_id + i, 'name': row['name'], 'protein': row['protein'], 'carb': row['carb'],
+              'fat': row['fat'], 'calories': row['calories'], 'has_weight': False, 'link': row['link'],
+              'saved': True, 'qty': 1, 'servings': 1, 'user_id': user_id} for i, row in enumerate(values)]
+    db.session.execute(Item.__table__.insert(), items)
+    insert_names(Item, items)
+
+    return None
+
+
+def insert_products(values: list, user_id: int) -> None:
+    """
+    Inserts products together with their saved Items (per 100 g) with one executemany statement per table.
+
+    :param values: validated rows
+    :param user_id: id of the User adding the products
+    :return: None
+    """
+    first_product_id, first_item_id, first_assoc_id = next_id(Product), next_id(Item), next_id(ItemProductAssoc)
+    products, items, assocs = [], [], []
+    for i, row in enumerate(values):
+        macros = {'name': row['name'], 'protein': row['protein'], 'carb': row['carb'], 'fat': row['fat'],
+                  'calories': row['calories']}
+        products.append(dict(macros, id=first_product_id + i, weight_per_ea=0))
+        items.append(dict(macros, id=first_item_id + i, has_weight=True, saved=True, qty=0, servings=0,
+                          user_id=user_id))
+        assocs.append({'id': first_assoc_id + i, 'item_id': first_item_id + i, 'product_id': first_product_id + i,
+                       'qty': 100})
+    db.session.execute(Product.__table__.insert(), products)
+    db.session.execute(Item.__table__.insert(), items)
+    db.session.execute(ItemProductAssoc.__table__.insert(), assocs)
+    insert_names(Product, products)
+    insert_names(Item, items)
+
+    return None
+
+
+# imported kinds of data: (function inserting validated rows, model used for deduplication)
+IMPORTERS = {
+    'meals': (insert_meals, Item),
+    'products': (insert_products, Product),
+}
+
+
+def run_import(file: str, kind: str, user_id: int, batch_size: int = 5000, resume: bool = False,
+               workers: int = None, report=print) -> dict:
+    """
+    Imports a CSV file: rows are validated by worker processes, deduplicated and inserted by this process.
+
+    Rows are inserted with Core statements and never become ORM objects, so memory use depends only on the batch size
+    and the deduplication index. Rows that have the same name and macronutrients as an existing (or earlier) row are
+    skipped, so that running the same import again does not duplicate data. A checkpoint with the number of processed
+    rows is stored after every committed batch and a failed import can be resumed.
+
+    :param file: path of the CSV file
+    :param kind: 'meals' or 'products'
+    :param user_id: id of the User adding the data
+    :param batch_size: number of rows validated, inserted and committed at once
+    :param resume: if True, rows processed by a previous run are skipped
+    :param workers: number of validation processes. Default None means all cores, 0 means no pool.
+    :param report: function called with a progress message after every batch and with every invalid row
+    :return: dictionary with numbers of 'imported', 'duplicate' and 'invalid' rows
+    """
+    insert, model = IMPORTERS[kind]
+    checkpoint = Checkpoint(file)
+    done = checkpoint.load() if resume else 0
+    seen = existing_keys(model)
+    counts = {'imported': 0, 'duplicate': 0, 'invalid': 0}
+    processed = 0
+    start = time.monotonic()
+    for values, errors, size in validated_batches(file, batch_size, skip=done, workers=workers):
+        for line, message in errors:
+            report(f"Line {line} skipped: {message}")
+        unique = []
+        for row in values:
+            if row['key'] not in seen:
+                seen.add(row['key'])
+                unique.append(row)
+        try:
+            if unique:
+                insert(unique, user_id)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        done += size
+        processed += size
+        counts['imported'] += len(unique)
+        counts['duplicate'] += len(values) - len(unique)
+        counts['invalid'] += len(errors)
+        checkpoint.save(done)
+        report(f"{done} rows processed, {counts['imported']} imported "
+               f"({processed / max(time.monotonic() - start, 1e-9):.0f} rows/s)")
+    checkpoint.clear()
+
+    return counts
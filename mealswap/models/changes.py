@@ -0,0 +1,134 @@
+"""Changes of rows collected during a transaction and applied to in-process caches after commit"""
+import time
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+# trackers by name, changes of every tracker are kept in session.info['changes'][name]
+trackers = {}
+
+
+class ChangeTracker:
+    """A class used to patch an in-process cache with rows changed by committed transactions.
+
+    Mapper events of the cache call record, changes are kept in the session together with the transaction or savepoint
+    they were flushed in. After the outermost transaction is committed, the changes are passed to the apply callback.
+    When a transaction or a savepoint is rolled back, only changes flushed inside it are forgotten.
+    """
+
+    def __init__(self, name: str, apply):
+        """
+        :param name: unique name of the tracker
+        :param apply: function called after commit with a dictionary of recorded changes, in the order of recording
+        """
+        self.name = name
+        self.apply = apply
+        trackers[name] = self
+
+    def record(self, target, key, value=None) -> None:
+        """
+        Records a change of an object in the session of the object.
+
+        :param target: changed object
+        :param key: key of the change, a later change with the same key replaces the earlier one
+        :param value: value of the change passed to the apply callback
+        :return: None
+        """
+        session = object_session(target)
+        if session is None:
+            return None
+        transaction = session.get_nested_transaction() or session.get_transaction()
+        changes = session.info.setdefault('changes', {}).setdefault(self.name, [])
+        if not changes or changes[-1][0] is not transaction:
+            changes.append((transaction, {}))
+        changes[-1][1][key] = value
+
+        return None
+
+
+class VersionCheck:
+    """A class used to notice changes that a ChangeTracker cannot see, made by other processes or by Core statements.
+
+    A cheap version query is run at most once per ttl seconds, the cache is stale if its result differs from the
+    version read when the cache was built.
+    """
+
+    def __init__(self, version, ttl: float):
+        """
+        :param version: function returning a value that changes when the cached rows change
+        :param ttl: minimum number of seconds between two checks
+        """
+        self.version = version
+        self.ttl = ttl
+        self.current = None
+        self.checked = 0.0
+
+    def read(self) -> None:
+        """
+        Reads the version of the rows, to be called before the cache reads the rows themselves.
+
+        :return: None
+        """
+        self.current = self.version()
+        self.checked = time.monotonic()
+
+        return None
+
+    def stale(self) -> bool:
+        """
+        Checks if the rows have changed since the version was read, unless they have been checked within ttl.
+
+        :return: True if the cache has to be rebuilt, False otherwise
+        """
+        if time.monotonic() - self.checked < self.ttl:
+            return False
+        self.checked = time.monotonic()
+        return self.version() != self.current
+
+
+def _within(transaction, ancestor) -> bool:
+    """Checks if transaction is the ancestor transaction or one of the transactions started inside it."""
+    while transaction is not None:
+        if transaction is ancestor:
+            return True
+        transaction = transaction.parent
+    return False
+
+
+def _apply_changes(session: Session) -> None:
+    """Passes changes of the committed transaction to their trackers."""
+    if session.in_nested_transaction():
+        # a released savepoint, its changes are applied with the outermost transaction
+        return None
+    for name, changes in session.info.pop('changes', {}).items():
+        merged = {}
+        for transaction, recorded in changes:
+            merged.update(recorded)
+        trackers[name].apply(merged)
+
+    return None
+
+
+def _discard_changes(session: Session, previous_transaction) -> None:
+    """Forgets changes flushed in the transaction or savepoint that has been rolled back."""
+    # a subtransaction (e.g. of a failed flush) rolls back up to the enclosing savepoint or transaction
+    boundary = previous_transaction
+    while boundary.parent is not None and not boundary.nested:
+        boundary = boundary.parent
+    for name, changes in session.info.get('changes', {}).items():
+        changes[:] = [(transaction, recorded) for transaction, recorded in changes
+                      if not _within(transaction, boundary)]
+
+    return None
+
+
+def init_changes() -> None:
+    """
+    Registers session events that apply or forget changes recorded by trackers.
+
+    :return: None
+    """
+    if not event.contains(Session, 'after_commit', _apply_changes):
+        event.listen(Session, 'after_commit', _apply_changes)
+        event.listen(Session, 'after_soft_rollback', _discard_changes)
+
+    return None
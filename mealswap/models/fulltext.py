@@ -0,0 +1,189 @@
+"""Full-text name search backed by SQLite FTS5"""
+import re
+import time
+import unicodedata
+from sqlalchemy import event, inspect, select, table, column, text
+from mealswap.extensions import db
+from mealswap.models.models import Item, Product
+from mealswap.settings import FULLTEXT_CHECK_TTL
+
+# letters that have no unicode decomposition and have to be folded explicitly
+FOLDED_LETTERS = str.maketrans({'ł': 'l', 'Ł': 'L', 'ø': 'o', 'Ø': 'O', 'đ': 'd', 'Đ': 'D', 'ß': 'ss'})
+
+# full-text tables for searched models, rowid of a full-text row is the id of the indexed object
+fulltext_tables = {model.__tablename__: table(f'{model.__tablename__}_fts', column('rowid'), column('name'),
+                                              column('rank'))
+                   for model in (Item, Product)}
+
+# (available, time of the check) per database url
+_available = {}
+
+
+def fold(value: str) -> str:
+    """
+    Folds text for searching: removes diacritics (including Polish 'ł') and changes letters to lowercase.
+
+    :param value: text to be folded
+    :return: folded text
+    """
+    value = unicodedata.normalize('NFKD', value.translate(FOLDED_LETTERS))
+    return ''.join(c for c in value if not unicodedata.combining(c)).lower()
+
+
+def match_expression(name: str) -> str or None:
+    """
+    Creates FTS5 query that matches all words of the searched name by prefix.
+
+    :param name: searched name
+    :return: FTS5 query or None if the name does not contain any words
+    """
+    words = re.findall(r'\w+', fold(name))
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def fulltext_available(connection=None, max_age: float = FULLTEXT_CHECK_TTL) -> bool:
+    """
+    Checks if full-text tables have been created in the database (see create_fulltext_tables).
+
+    The result is cached for max_age seconds, so that tables created by `flask upgrade` while the app is running are
+    used without a restart.
+
+    :param connection: connection to be used, default None means the session connection
+    :param max_age: number of seconds after which the cached result is checked again
+    :return: True if full-text tables exist, False otherwise
+    """
+    connection = connection or db.session.connection()
+    url = str(connection.engine.url)
+    available, checked = _available.get(url, (None, 0.0))
+    if available is None or time.monotonic() - checked >= max_age:
+        if connection.dialect.name != 'sqlite':
+            available = False
+        else:
+            names = set(inspect(connection).get_table_names())
+            available = all(fts.name in names for fts in fulltext_tables.values())
+        _available[url] = (available, time.monotonic())
+    return available
+
+
+def _writable(connection) -> bool:
+    """Checks if names have to be written to full-text tables, a cached False is always checked again."""
+    return fulltext_available(connection) or fulltext_available(connection, max_age=0)
+
+
+def filter_by_name(query, model, name: str):
+    """
+    Filters query by name of the model, ordering results by relevance.
+
+    Uses the full-text index when it is available, otherwise falls back to substring search.
+
+    :param query: SQLAlchemy query of the model
+    :param model: Item or Product
+    :param name: searched name
+    :return: filtered query
+    """
+    expression = match_expression(name)
+    if expression is None or not fulltext_available():
+        return query.filter(model.name.contains(name))
+    fts = fulltext_tables[model.__tablename__]
+    return query.join(fts, fts.c.rowid == model.id).filter(fts.c.name.op('MATCH')(expression))\
+        .order_by(fts.c.rank, model.id)
+
+
+def name_rank(model, name: str):
+    """
+    Returns relevance of the rows filtered by filter_by_name, lower values are more relevant.
+
+    :param model: Item or Product
+    :param name: searched name
+    :return: rank column of the full-text table or None if filter_by_name falls back to substring search
+    """
+    if match_expression(name) is None or not fulltext_available():
+        return None
+    return fulltext_tables[model.__tablename__].c.rank
+
+
+def create_fulltext_tables() -> int:
+    """
+    Creates full-text tables (if they do not exist) and fills them again with names of existing items and products.
+
+    :return: number of indexed names
+    """
+    connection = db.session.connection()
+    if connection.dialect.name != 'sqlite':
+        return 0
+    count = 0
+    for model in (Item, Product):
+        fts = fulltext_tables[model.__tablename__]
+        connection.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts.name} "
+                                f"USING fts5(name, tokenize = 'unicode61 remove_diacritics 2')"))
+        connection.execute(text(f"DELETE FROM {fts.name}"))
+        rows = connection.execute(select(model.id, model.name)).all()
+        if rows:
+            connection.execute(text(f"INSERT INTO {fts.name} (rowid, name) VALUES (:id, :name)"),
+                               [{'id': row.id, 'name': fold(row.name)} for row in rows])
+        count += len(rows)
+    _available.clear()
+
+    return count
+
+
+def insert_names(model, rows: list) -> None:
+    """
+    Adds names of rows inserted without the ORM (e.g. by bulk imports) to the full-text table.
+
+    :param model: Item or Product
+    :param rows: list of dictionaries with id and name keys
+    :return: None
+    """
+    connection = db.session.connection()
+    if rows and _writable(connection):
+        fts = fulltext_tables[model.__tablename__]
+        connection.execute(text(f"INSERT INTO {fts.name} (rowid, name) VALUES (:id, :name)"),
+                           [{'id': row['id'], 'name': fold(row['name'])} for row in rows])
+
+    return None
+
+
+def _insert_name(mapper, connection, target) -> None:
+    """Adds name of the inserted object to the full-text table."""
+    if _writable(connection):
+        fts = fulltext_tables[mapper.local_table.name]
+        connection.execute(text(f"INSERT INTO {fts.name} (rowid, name) VALUES (:id, :name)"),
+                           {'id': target.id, 'name': fold(target.name)})
+
+    return None
+
+
+def _update_name(mapper, connection, target) -> None:
+    """Replaces name of the updated object in the full-text table."""
+    if inspect(target).attrs.name.history.has_changes() and _writable(connection):
+        _delete_name(mapper, connection, target)
+        _insert_name(mapper, connection, target)
+
+    return None
+
+
+def _delete_name(mapper, connection, target) -> None:
+    """Removes name of the deleted object from the full-text table."""
+    if _writable(connection):
+        fts = fulltext_tables[mapper.local_table.name]
+        connection.execute(text(f"DELETE FROM {fts.name} WHERE rowid = :id"), {'id': target.id})
+
+    return None
+
+
+def init_fulltext() -> None:
+    """
+    Registers events that keep full-text tables in sync with Item and Product names.
+
+    :return: None
+    """
+    for model in (Item, Product):
+        if not event.contains(model, 'after_insert', _insert_name):
+            event.listen(model, 'after_insert', _insert_name)
+            event.listen(model, 'after_update', _update_name)
+            event.listen(model, 'after_delete', _delete_name)
+
+    return None
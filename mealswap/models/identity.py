@@ -0,0 +1,120 @@
+"""Process-level cache of rarely changed rows looked up by id"""
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.util import identity_key
+from mealswap.cache import MemoryBackend
+from mealswap.models.changes import ChangeTracker
+from mealswap.extensions import db
+from mealswap.models.models import User, Settings, Item, Product
+from mealswap.settings import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+
+# models whose rows are cached, with a function deciding if a row can be cached
+CACHED_MODELS = {
+    User: lambda user: True,
+    Settings: lambda settings: True,
+    Item: lambda item: bool(item.saved),
+    Product: lambda product: True,
+}
+
+
+class IdentityCache:
+    """A class used to look up rows by id without a round trip to the database.
+
+    The identity map of the current session is checked first, then detached copies of hot rows kept by the process
+    for ttl seconds, and only then the database. Cached rows are merged into the session without loading, so every
+    request still gets its own instance. Rows changed in this process are removed from the cache when the transaction
+    is committed; changes made by other processes are visible after ttl at the latest.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 60):
+        """
+        :param max_size: maximum number of cached rows
+        :param ttl: number of seconds after which a cached row is loaded again
+        """
+        self.rows = MemoryBackend(max_size=max_size, ttl=ttl)
+
+    @staticmethod
+    def key(model, element_id: int) -> str:
+        """Returns cache key of the row."""
+        return f'{model.__tablename__}:{element_id}'
+
+    def get(self, model, element_id: int) -> db.Model or None:
+        """
+        Returns row of the model with the id, attached to the current session.
+
+        :param model: SQLAlchemy model
+        :param element_id: primary key of the row
+        :return: model object or None if not found
+        """
+        session = db.session()
+        instance = session.identity_map.get(identity_key(model, element_id))
+        if instance is not None or model not in CACHED_MODELS:
+            return instance if instance is not None else session.get(model, element_id)
+        cached = self.rows.get(self.key(model, element_id))
+        if cached is not None:
+            return session.merge(cached, load=False)
+        instance = session.get(model, element_id)
+        if instance is not None and not session.is_modified(instance) and CACHED_MODELS[model](instance):
+            self.rows.set(self.key(model, element_id), detached_copy(instance))
+        return instance
+
+    def discard(self, key: str) -> None:
+        """
+        Removes a row from the cache.
+
+        :param key: cache key of the row
+        :return: None
+        """
+        self.rows.delete(key)
+
+        return None
+
+
+def detached_copy(instance: db.Model) -> db.Model:
+    """
+    Returns a detached copy of the loaded columns of an object that can be merged into other sessions.
+
+    :param instance: persistent object
+    :return: detached object with the same identity
+    """
+    mapper = inspect(instance).mapper
+    copy = mapper.class_manager.new_instance()
+    for attribute in mapper.column_attrs:
+        setattr(copy, attribute.key, getattr(instance, attribute.key))
+    make_transient_to_detached(copy)
+    return copy
+
+
+identity_cache = IdentityCache(max_size=IDENTITY_CACHE_SIZE, ttl=IDENTITY_CACHE_TTL)
+
+
+def _apply_changes(changes: dict) -> None:
+    """Removes rows changed in the committed transaction from the cache."""
+    for key in changes:
+        identity_cache.discard(key)
+
+    return None
+
+
+identity_changes = ChangeTracker('identity', _apply_changes)
+
+
+def _record_change(mapper, connection, target) -> None:
+    """Records changed or deleted row, so that it can be removed from the cache after commit."""
+    identity_changes.record(target, IdentityCache.key(mapper.class_, target.id))
+
+    return None
+
+
+def init_identity_cache() -> None:
+    """
+    Registers events that remove changed rows from the identity cache.
+
+    :return: None
+    """
+    for model in CACHED_MODELS:
+        if not event.contains(model, 'after_update', _record_change):
+            event.listen(model, 'after_update', _record_change)
+            event.listen(model, 'after_delete', _record_change)
+
+    return None
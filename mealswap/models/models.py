@@ -3,6 +3,7 @@ from mealswap.extensions import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from sqlalchemy.orm import relationship
+from mealswap.models.nutrients import NutrientVector
 
 
 class User(UserMixin, db.Model):
@@ -78,6 +79,7 @@ class Settings(db.Model):
     (not implemented)
     """
     __tablename__ = 'settings'
+    __table_args__ = (db.Index('ix_settings_user_id', 'user_id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -92,6 +94,8 @@ class Settings(db.Model):
 class RatingsAssoc(db.Model):
     """Association table to represent item ratings by users."""
     __tablename__ = 'ratings_assoc'
+    __table_args__ = (db.Index('ix_ratings_assoc_user_id_item_id', 'user_id', 'item_id', unique=True),
+                      db.Index('ix_ratings_assoc_item_id', 'item_id'))
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.ForeignKey('user.id'))
@@ -103,6 +107,7 @@ class RatingsAssoc(db.Model):
 class DietItemAssoc(db.Model):
     """Association table to represent items contained in particular diet days."""
     __tablename__ = "diet_item_assoc"
+    __table_args__ = (db.Index('ix_diet_item_assoc_diet_id', 'diet_id'),)
 
     id = db.Column(db.Integer, index=True, primary_key=True, autoincrement=True)
     diet_id = db.Column(db.ForeignKey('day_diet.id'))
@@ -117,8 +122,11 @@ class DayDiet(db.Model):
     Class has relationships with:
     - Item class - many-to-many
     - User class - many-to-one
+    - DaySummary class - one-to-one
     """
     __tablename__ = 'day_diet'
+    __table_args__ = (db.Index('ix_day_diet_user_id_date', 'user_id', 'date'),
+                      db.Index('ix_day_diet_date', 'date'))
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -126,6 +134,7 @@ class DayDiet(db.Model):
     date = db.Column(db.Date, nullable=False)
     weight = db.Column(db.Float)  # not implemented, weight of the user
     items = relationship("DietItemAssoc")
+    summary = relationship("DaySummary", uselist=False, back_populates='diet', cascade='all, delete-orphan')
 
     def __init__(self, user: User, date: dt.date):
         """
@@ -137,9 +146,28 @@ class DayDiet(db.Model):
         self.date = date
 
 
+class DaySummary(db.Model):
+    """A class used to represent precomputed nutrition totals of a diet day (one-to-one relationship).
+
+    Totals are kept up to date by controls changing diet positions, see mealswap.models.summary.
+    """
+    __tablename__ = 'day_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    diet_id = db.Column(db.Integer, db.ForeignKey('day_diet.id'), unique=True, nullable=False)
+    diet = relationship('DayDiet', back_populates='summary')
+    calories = db.Column(db.Float, nullable=False, default=0)
+    protein = db.Column(db.Float, nullable=False, default=0)
+    carb = db.Column(db.Float, nullable=False, default=0)
+    fat = db.Column(db.Float, nullable=False, default=0)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+
+
 class ItemProductAssoc(db.Model):
     """Association table to join items and products"""
     __tablename__ = "item_product_assoc"
+    __table_args__ = (db.Index('ix_item_product_assoc_item_id', 'item_id'),
+                      db.Index('ix_item_product_assoc_product_id', 'product_id'))
 
     id = db.Column(db.Integer, index=True, primary_key=True)
     item_id = db.Column(db.ForeignKey('item.id'))
@@ -158,6 +186,9 @@ class Item(db.Model):
     - RatingsAssoc: association
     """
     __tablename__ = 'item'
+    __table_args__ = (db.Index('ix_item_saved_name', 'saved', 'name'),
+                      db.Index('ix_item_user_id_saved', 'user_id', 'saved'),
+                      db.Index('ix_item_saved_has_weight', 'saved', 'has_weight'))
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(250), nullable=False)
@@ -202,10 +233,7 @@ class Item(db.Model):
         self.has_weight = has_weight
         self.qty = qty
         self.servings = servings
-        if calories:
-            self.calories = calories
-        else:
-            self.calories = protein*4 + carb*4 + fat*9
+        self.calories = NutrientVector.from_macros(protein, carb, fat, calories).calories
         if link:
             self.link = link
         if recipe:
@@ -247,8 +275,5 @@ class Product(db.Model):
         self.protein = protein
         self.carb = carb
         self.fat = fat
-        if calories:
-            self.calories = calories
-        else:
-            self.calories = protein*4 + carb*4 + fat*9
+        self.calories = NutrientVector.from_macros(protein, carb, fat, calories).calories
         self.weight_per_ea = weight_per_ea
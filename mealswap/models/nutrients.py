@@ -0,0 +1,163 @@
+"""Calories and macronutrients as fixed-size vectors"""
+import numpy as np
+
+# order of values in nutrient vectors, the same as the nutrition columns of Item, Product and DaySummary
+NUTRIENTS = ('calories', 'protein', 'carb', 'fat')
+
+# calories in 1 g of protein, carbohydrates and fat
+CALORIES_PER_GRAM = {'protein': 4, 'carb': 4, 'fat': 9}
+
+
+def calories_from_macros(protein, carb, fat):
+    """
+    Calculates calories from macronutrient amounts.
+
+    Works for single values as well as NumPy arrays of amounts.
+
+    :param protein: amount of protein in grams
+    :param carb: amount of carbohydrates in grams
+    :param fat: amount of fat in grams
+    :return: calories
+    """
+    return protein*CALORIES_PER_GRAM['protein'] + carb*CALORIES_PER_GRAM['carb'] + fat*CALORIES_PER_GRAM['fat']
+
+
+class NutrientVector:
+    """A class that represents calories and macronutrients of food as one array.
+
+    Values are kept in the order of NUTRIENTS. Vectors can be added, subtracted and multiplied or divided by numbers.
+    """
+    __slots__ = ('values',)
+
+    def __init__(self, calories: float = 0, protein: float = 0, carb: float = 0, fat: float = 0):
+        """
+        :param calories: number of calories
+        :param protein: amount of protein
+        :param carb: amount of carbohydrates
+        :param fat: amount of fat
+        """
+        self.values = np.array((calories, protein, carb, fat), dtype=np.float64)
+
+    @classmethod
+    def from_array(cls, values: np.ndarray) -> 'NutrientVector':
+        """
+        Creates a vector from an array of values in the order of NUTRIENTS.
+
+        :param values: array of 4 values
+        :return: NutrientVector object
+        """
+        vector = cls.__new__(cls)
+        vector.values = np.asarray(values, dtype=np.float64).reshape(len(NUTRIENTS))
+        return vector
+
+    @classmethod
+    def from_macros(cls, protein: float, carb: float, fat: float, calories: float = None) -> 'NutrientVector':
+        """
+        Creates a vector from macronutrient amounts.
+
+        :param protein: amount of protein
+        :param carb: amount of carbohydrates
+        :param fat: amount of fat
+        :param calories: number of calories. Default None means that calories are calculated from macronutrients.
+        :return: NutrientVector object
+        """
+        return cls(calories or calories_from_macros(protein, carb, fat), protein, carb, fat)
+
+    @classmethod
+    def of(cls, element) -> 'NutrientVector':
+        """
+        Reads the vector of an object with nutrition attributes, e.g. Item, Product or a row of their columns.
+
+        :param element: object with calories, protein, carb and fat attributes
+        :return: NutrientVector object
+        """
+        return cls(*(getattr(element, name) or 0 for name in NUTRIENTS))
+
+    def apply_to(self, element) -> None:
+        """
+        Writes the values to nutrition attributes of an object.
+
+        :param element: object with calories, protein, carb and fat attributes, e.g. Item
+        :return: None
+        """
+        for name, value in zip(NUTRIENTS, self.values.tolist()):
+            setattr(element, name, value)
+
+        return None
+
+    def mix(self, qty: float, added: 'NutrientVector', added_qty: float) -> 'NutrientVector':
+        """
+        Returns values per unit of a mixture, e.g. of a meal after adding (or removing, with negative qty) a product.
+
+        :param qty: quantity of food with values of this vector
+        :param added: values per unit of the added food
+        :param added_qty: quantity of the added food, negative for removed food
+        :return: NutrientVector object, zero vector if nothing is left
+        """
+        total_qty = qty + added_qty
+        if total_qty == 0:
+            return NutrientVector()
+        return NutrientVector.from_array((self.values * qty + added.values * added_qty) / total_qty)
+
+    @property
+    def calories(self) -> float:
+        return float(self.values[0])
+
+    @property
+    def protein(self) -> float:
+        return float(self.values[1])
+
+    @property
+    def carb(self) -> float:
+        return float(self.values[2])
+
+    @property
+    def fat(self) -> float:
+        return float(self.values[3])
+
+    def __add__(self, other: 'NutrientVector') -> 'NutrientVector':
+        return NutrientVector.from_array(self.values + other.values)
+
+    def __sub__(self, other: 'NutrientVector') -> 'NutrientVector':
+        return NutrientVector.from_array(self.values - other.values)
+
+    def __mul__(self, factor: float) -> 'NutrientVector':
+        return NutrientVector.from_array(self.values * factor)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, divisor: float) -> 'NutrientVector':
+        return NutrientVector.from_array(self.values / divisor)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, NutrientVector) and bool(np.array_equal(self.values, other.values))
+
+    def __iter__(self):
+        return iter(self.values.tolist())
+
+    def __repr__(self):
+        return 'NutrientVector({})'.format(', '.join(f'{name}={value:g}' for name, value in zip(NUTRIENTS, self)))
+
+
+def to_matrix(elements: list) -> np.ndarray:
+    """
+    Reads nutrient vectors of many objects into one array.
+
+    :param elements: list of objects with calories, protein, carb and fat attributes
+    :return: array of shape (len(elements), 4)
+    """
+    matrix = np.array([[getattr(element, name) or 0 for name in NUTRIENTS] for element in elements], dtype=np.float64)
+    return matrix.reshape(-1, len(NUTRIENTS))
+
+
+def weighted_averages(weights, values: np.ndarray) -> np.ndarray:
+    """
+    Calculates weighted averages of nutrient vectors for many mixtures at once, e.g. values per 100 g of all meals.
+
+    :param weights: array or SciPy sparse matrix of shape (mixtures, components) with quantities of components
+    :param values: array of shape (components, 4) with nutrient vectors of components
+    :return: array of shape (mixtures, 4), rows of mixtures without quantity are zero
+    """
+    totals = np.asarray(weights @ values, dtype=np.float64).reshape(-1, len(NUTRIENTS))
+    quantities = np.asarray(weights.sum(axis=1), dtype=np.float64).reshape(-1, 1)
+    return np.divide(totals, quantities, out=np.zeros_like(totals), where=quantities != 0)
@@ -0,0 +1,105 @@
+"""Schema upgrades for existing databases"""
+from sqlalchemy import inspect, select, text
+from mealswap.extensions import db
+from mealswap.models.fulltext import create_fulltext_tables
+from mealswap.models.summary import rebuild_day_summaries
+
+# table that stores the version of the schema applied to the database
+schema_version = db.Table('schema_version', db.Column('version', db.Integer, nullable=False))
+
+
+def get_schema_version() -> int:
+    """
+    Returns the version of the schema applied to the database.
+
+    :return: schema version, 0 for databases that have never been upgraded
+    """
+    version = db.session.execute(select(schema_version.c.version)).scalar()
+    return version or 0
+
+
+def set_schema_version(version: int) -> None:
+    """
+    Stores the version of the schema applied to the database.
+
+    :param version: schema version
+    :return: None
+    """
+    db.session.execute(schema_version.delete())
+    db.session.execute(schema_version.insert().values(version=version))
+
+    return None
+
+
+def create_missing_indexes() -> None:
+    """
+    Creates indexes declared in models that are missing in the database.
+
+    Duplicate ratings (the same item rated more than once by the same user) are removed first, keeping the latest one,
+    so that the unique index on ratings can be created.
+
+    :return: None
+    """
+    db.session.execute(text("DELETE FROM ratings_assoc WHERE id NOT IN "
+                            "(SELECT MAX(id) FROM ratings_assoc GROUP BY user_id, item_id)"))
+    connection = db.session.connection()
+    inspector = inspect(connection)
+    for table in db.metadata.sorted_tables:
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=connection)
+
+    return None
+
+
+# ordered list of (version, upgrade function); every function has to be safe to run on a freshly created database
+MIGRATIONS = [
+    (1, create_missing_indexes),
+    (2, create_fulltext_tables),
+    (3, rebuild_day_summaries),
+]
+
+
+def upgrade_schema() -> list:
+    """
+    Creates missing tables and applies migrations newer than the version of the database.
+
+    :return: list of applied versions
+    """
+    db.create_all()
+    current = get_schema_version()
+    applied = []
+    for version, upgrade in MIGRATIONS:
+        if version > current:
+            upgrade()
+            set_schema_version(version)
+            applied.append(version)
+    db.session.commit()
+
+    return applied
+
+
+def explain_statement(statement: str, parameters) -> list:
+    """
+    Returns SQLite query plan of an executed SQL statement.
+
+    :param statement: SQL statement as sent to the database driver
+    :param parameters: parameters of the statement as sent to the database driver
+    :return: list of plan steps, e.g. 'SEARCH item USING INDEX ix_item_saved_name (saved=?)'
+    """
+    rows = db.session.connection().exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan: list) -> list:
+    """
+    Returns steps of the query plan that read a whole table.
+
+    Scans of constant rows and of subquery results, e.g. 'SCAN (subquery-2)', do not read a table.
+
+    :param plan: list of plan steps returned by explain_statement
+    :return: list of steps that scan a table
+    """
+    return [step for step in plan if step.startswith('SCAN ') and 'USING' not in step and 'VIRTUAL TABLE' not in step
+            and not step.startswith(('SCAN CONSTANT ROW', 'SCAN ('))]
@@ -0,0 +1,83 @@
+"""Precomputed nutrition totals of diet days"""
+from mealswap.extensions import db
+from mealswap.models.models import DayDiet, DaySummary, DietItemAssoc, Item
+from mealswap.models.nutrients import NUTRIENTS
+
+
+def totals_query(diet_ids: list = None):
+    """
+    Returns query of nutrition totals of diets computed from their positions.
+
+    Items with weight have values per 100 g and qty in grams, other Items have values per serving and qty in servings.
+
+    :param diet_ids: ids of diets to be computed. Default None means all diets.
+    :return: SQLAlchemy query of (diet_id, calories, protein, carb, fat, item_count) rows
+    """
+    factor = db.case((Item.has_weight == True, DietItemAssoc.qty / 100), else_=DietItemAssoc.qty)
+    query = db.session.query(DietItemAssoc.diet_id,
+                             *(db.func.coalesce(db.func.sum(getattr(Item, name) * factor), 0) for name in NUTRIENTS),
+                             db.func.count(DietItemAssoc.id))\
+        .join(Item, DietItemAssoc.item_id == Item.id).group_by(DietItemAssoc.diet_id)
+    if diet_ids is not None:
+        query = query.filter(DietItemAssoc.diet_id.in_(diet_ids))
+    return query
+
+
+def set_totals(summary: DaySummary, row) -> None:
+    """
+    Copies totals to the summary.
+
+    :param summary: DaySummary object
+    :param row: row of totals_query or None for a diet without positions
+    :return: None
+    """
+    values = row[1:] if row is not None else (0,) * (len(NUTRIENTS) + 1)
+    for name, value in zip(NUTRIENTS + ('item_count',), values):
+        setattr(summary, name, value)
+
+    return None
+
+
+def update_day_summary(diet: DayDiet) -> DaySummary:
+    """
+    Recomputes the summary of the diet in the current transaction.
+
+    Has to be called after changing positions of the diet and before committing, so that the summary is committed
+    (or rolled back) together with the positions.
+
+    :param diet: DayDiet object
+    :return: DaySummary object
+    """
+    db.session.flush()
+    if diet.summary is None:
+        diet.summary = DaySummary()
+    set_totals(diet.summary, totals_query([diet.id]).first())
+
+    return diet.summary
+
+
+def rebuild_day_summaries(batch_size: int = 500, diet_ids: list = None) -> int:
+    """
+    Recomputes summaries of all diets and removes summaries of deleted diets.
+
+    :param batch_size: number of diets computed in one query
+    :param diet_ids: ids of diets to be recomputed, e.g. diets containing changed Items. Default None means all diets.
+    :return: number of diets
+    """
+    if diet_ids is None:
+        DaySummary.query.filter(DaySummary.diet_id.notin_(db.session.query(DayDiet.id)))\
+            .delete(synchronize_session=False)
+        diet_ids = [row.id for row in db.session.query(DayDiet.id).order_by(DayDiet.id)]
+    for start in range(0, len(diet_ids), batch_size):
+        batch = diet_ids[start:start + batch_size]
+        totals = {row[0]: row for row in totals_query(batch)}
+        summaries = {summary.diet_id: summary for summary in DaySummary.query.filter(DaySummary.diet_id.in_(batch))}
+        for diet_id in batch:
+            summary = summaries.get(diet_id)
+            if summary is None:
+                summary = DaySummary(diet_id=diet_id)
+                db.session.add(summary)
+            set_totals(summary, totals.get(diet_id))
+        db.session.flush()
+
+    return len(diet_ids)
@@ -0,0 +1,54 @@
+"""Counting SQL queries executed by the app"""
+from contextlib import contextmanager
+from sqlalchemy import event
+from mealswap.extensions import db
+
+
+class QueryCounter:
+    """A class used to count statements executed by the database engine."""
+
+    def __init__(self):
+        self.statements = []
+        self.parameters = []
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        """Listener of the before_cursor_execute event."""
+        self.statements.append(statement)
+        self.parameters.append(parameters)
+
+        return None
+
+
+@contextmanager
+def count_queries():
+    """
+    Counts SQL statements executed inside the block.
+
+    :return: QueryCounter object with executed statements
+    """
+    counter = QueryCounter()
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', counter.record)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter.record)
+
+
+@contextmanager
+def assert_max_queries(limit: int, name: str = 'block'):
+    """
+    Fails if the block executes more than limit SQL statements.
+
+    :param limit: maximum number of statements
+    :param name: name of the block used in the error message, e.g. an endpoint
+    :return: QueryCounter object with executed statements
+    """
+    with count_queries() as counter:
+        yield counter
+    if len(counter) > limit:
+        statements = '\n'.join(counter.statements)
+        raise AssertionError(f'{name} executed {len(counter)} queries, expected at most {limit}:\n{statements}')
@@ -8,6 +8,28 @@ MAIL_PASSWORD = env_config['MAIL_PASSWORD']
 SECRET_KEY = env_config['SECRET_KEY']
 SECURITY_PASSWORD_SALT = env_config['SECURITY_PASSWORD_SALT']
 SQLALCHEMY_DATABASE_URI = env_config['SQLALCHEMY_DATABASE_URI']
+RECOMMENDER_MODEL_PATH = env_config.get('RECOMMENDER_MODEL_PATH', 'mealswap/recommender.npz')
+RECOMMENDATION_CACHE_URL = env_config.get('RECOMMENDATION_CACHE_URL', 'memory://')
+RECOMMENDATION_CACHE_SIZE = int(env_config.get('RECOMMENDATION_CACHE_SIZE', 1024))
+RECOMMENDATION_CACHE_TTL = float(env_config.get('RECOMMENDATION_CACHE_TTL', 3600))
+# number of best ranked items cached per user, discover pages end after them
+RECOMMENDATION_COUNT = int(env_config.get('RECOMMENDATION_COUNT', 250))
+# calendars are invalidated only in the process that commits a diet, so with many workers either use a shared
+# backend (sqlite:/// or redis://) or keep the TTL short
+CALENDAR_CACHE_URL = env_config.get('CALENDAR_CACHE_URL', 'memory://')
+CALENDAR_CACHE_SIZE = int(env_config.get('CALENDAR_CACHE_SIZE', 1024))
+CALENDAR_CACHE_TTL = float(env_config.get('CALENDAR_CACHE_TTL', 60))
+RATE_PREFETCH = int(env_config.get('RATE_PREFETCH', 10))
+# queued ids are checked again when taken, so a per-process queue can only serve fewer items, never rated ones
+DISCOVER_QUEUE_URL = env_config.get('DISCOVER_QUEUE_URL', 'memory://')
+DISCOVER_QUEUE_SIZE = int(env_config.get('DISCOVER_QUEUE_SIZE', 1024))
+DISCOVER_QUEUE_TTL = float(env_config.get('DISCOVER_QUEUE_TTL', 600))
+# in-process item and name indexes check at most once per this many seconds if other processes changed the catalogue
+INDEX_CHECK_TTL = float(env_config.get('INDEX_CHECK_TTL', 10))
+# seconds after which a running app checks again if `flask upgrade` has created the full-text tables
+FULLTEXT_CHECK_TTL = float(env_config.get('FULLTEXT_CHECK_TTL', 60))
+IDENTITY_CACHE_SIZE = int(env_config.get('IDENTITY_CACHE_SIZE', 4096))
+IDENTITY_CACHE_TTL = float(env_config.get('IDENTITY_CACHE_TTL', 60))
 
 BOOTSTRAP_BTN_STYLE = 'success'
 SQLALCHEMY_TRACK_MODIFICATIONS = False